@@ -0,0 +1,426 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from fastapi import Response
+
+from ..embeddings.embeddings import normalize_text
+
+load_dotenv()
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+ANSWER_CACHE_MAX_PER_USER = int(os.getenv("ANSWER_CACHE_MAX_PER_USER", "64"))
+
+# Cosine similarity above which two questions count as the same question
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+# How long an authenticated user's id/role is trusted without a DB lookup
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+
+# Hot note texts for /AI/ask context; 0 entries disables the cache
+NOTE_CACHE_TTL = float(os.getenv("NOTE_CACHE_TTL", "60"))
+NOTE_CACHE_MAX_ENTRIES = int(os.getenv("NOTE_CACHE_MAX_ENTRIES", "5000"))
+
+# Serialized GET /notes responses, bounded by body bytes; 0 disables
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+
+# --------------------------------------------------
+# ANSWER CACHE
+# --------------------------------------------------
+
+@dataclass
+class CachedAnswer:
+    user_id: int
+    mode: str
+    question: str
+    answer: str
+    note_ids: frozenset
+    embedding: Optional[np.ndarray]
+    # users.notes_version the answer was built against; any note write
+    # since (in any worker) makes it stale
+    notes_version: int
+    expires_at: float
+
+
+def question_key(question: str) -> str:
+    return normalize_text(question).casefold()
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        ttl: float = ANSWER_CACHE_TTL,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        max_per_user: int = ANSWER_CACHE_MAX_PER_USER,
+        similarity: float = ANSWER_CACHE_SIMILARITY
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_per_user = max_per_user
+        self.similarity = similarity
+
+        # (user_id, mode, question key) -> entry, in LRU order
+        self._entries: OrderedDict[tuple, CachedAnswer] = OrderedDict()
+        self._by_user: dict[int, set] = {}
+        self._by_note: dict[int, set] = {}
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # ---------- internals (caller holds the lock) ----------
+
+    def _drop(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_keys = self._by_user.get(entry.user_id)
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._by_user[entry.user_id]
+        for note_id in entry.note_ids:
+            note_keys = self._by_note.get(note_id)
+            if note_keys is not None:
+                note_keys.discard(key)
+                if not note_keys:
+                    del self._by_note[note_id]
+
+    def _live(self, key: tuple, notes_version: int) -> Optional[CachedAnswer]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic() or entry.notes_version < notes_version:
+            self._drop(key)
+            return None
+        if entry.notes_version != notes_version:
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    # ---------- lookups ----------
+    # notes_version is the user's current users.notes_version, read by the
+    # caller before retrieval
+
+    def get_exact(self, user_id: int, mode: str, question: str, notes_version: int) -> Optional[CachedAnswer]:
+        with self._lock:
+            entry = self._live((user_id, mode, question_key(question)), notes_version)
+            if entry:
+                self.exact_hits += 1
+            return entry
+
+    def get_similar(self, user_id: int, mode: str, embedding, notes_version: int) -> Optional[CachedAnswer]:
+        query = _unit(embedding)
+        with self._lock:
+            best, best_score = None, self.similarity
+            for key in list(self._by_user.get(user_id, ())):
+                if key[1] != mode:
+                    continue
+                entry = self._live(key, notes_version)
+                if entry is None or entry.embedding is None:
+                    continue
+                score = float(entry.embedding @ query)
+                if score >= best_score:
+                    best, best_score = entry, score
+
+            if best:
+                self.similar_hits += 1
+            else:
+                self.misses += 1
+            return best
+
+    # ---------- writes ----------
+
+    def put(
+        self,
+        user_id: int,
+        mode: str,
+        question: str,
+        answer: str,
+        note_ids,
+        notes_version: int,
+        embedding=None
+    ) -> CachedAnswer:
+        key = (user_id, mode, question_key(question))
+        entry = CachedAnswer(
+            user_id=user_id,
+            mode=mode,
+            question=question,
+            answer=answer,
+            note_ids=frozenset(note_ids),
+            embedding=_unit(embedding) if embedding is not None else None,
+            notes_version=notes_version,
+            expires_at=time.monotonic() + self.ttl
+        )
+
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = entry
+            self._by_user.setdefault(user_id, set()).add(key)
+            for note_id in entry.note_ids:
+                self._by_note.setdefault(note_id, set()).add(key)
+
+            # Per-user bound first, then the global one (both LRU)
+            user_keys = self._by_user[user_id]
+            if len(user_keys) > self.max_per_user:
+                for old_key in list(self._entries):
+                    if old_key in user_keys and old_key != key:
+                        self._drop(old_key)
+                        break
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+        return entry
+
+    def invalidate_notes(self, note_ids):
+        with self._lock:
+            for note_id in note_ids:
+                for key in list(self._by_note.get(note_id, ())):
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._drop(key)
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+answer_cache = AnswerCache()
+
+
+# --------------------------------------------------
+# PRINCIPAL CACHE (get_current_user)
+# --------------------------------------------------
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    role: str
+    email: Optional[str] = None
+
+
+class PrincipalCache:
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[int, tuple[Principal, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        with self._lock:
+            item = self._entries.get(user_id)
+            if item is None or item[1] < time.monotonic():
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return item[0]
+
+    def put(self, principal: Principal) -> Principal:
+        with self._lock:
+            self._entries[principal.id] = (principal, time.monotonic() + self.ttl)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return principal
+
+    def invalidate(self, user_id: int):
+        # Must be called whenever a user is deleted or their role changes
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "ttl": self.ttl,
+            }
+
+
+principal_cache = PrincipalCache()
+
+
+# --------------------------------------------------
+# NOTE TEXT CACHE (context hydration)
+# --------------------------------------------------
+
+class NoteTextCache:
+    # note id -> (owner, text). Updates and deletes in this worker
+    # invalidate; the TTL bounds staleness from other workers.
+    def __init__(self, ttl: float = NOTE_CACHE_TTL, max_entries: int = NOTE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[int, tuple[int, str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, user_id: int, note_ids) -> dict[int, str]:
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for note_id in note_ids:
+                item = self._entries.get(note_id)
+                if item is None or item[0] != user_id or item[2] < now:
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end(note_id)
+                found[note_id] = item[1]
+                self.hits += 1
+        return found
+
+    def put(self, user_id: int, note_id: int, text: str) -> str:
+        if self.max_entries <= 0:
+            return text
+        with self._lock:
+            self._entries[note_id] = (user_id, text, time.monotonic() + self.ttl)
+            self._entries.move_to_end(note_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return text
+
+    def invalidate(self, note_ids):
+        with self._lock:
+            for note_id in note_ids:
+                self._entries.pop(note_id, None)
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for note_id in [k for k, item in self._entries.items() if item[0] == user_id]:
+                del self._entries[note_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+            }
+
+
+note_text_cache = NoteTextCache()
+
+
+# --------------------------------------------------
+# RESPONSE CACHE (GET /notes, keyed by notes_version)
+# --------------------------------------------------
+
+@dataclass
+class CachedResponse:
+    version: int
+    body: bytes
+    media_type: str
+    headers: dict
+
+
+class ResponseCache:
+    # (user_id, url) -> body rendered for one users.notes_version. The
+    # version is read on every request, so entries from other workers'
+    # writes are never served; local invalidation just frees memory early.
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple, CachedResponse] = OrderedDict()
+        self._by_user: dict[int, set] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _drop(self, key: tuple):
+        # Caller holds the lock
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= len(entry.body)
+        keys = self._by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[key[0]]
+
+    def get(self, user_id: int, url: str, version: int) -> Optional[Response]:
+        key = (user_id, url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return Response(content=entry.body, media_type=entry.media_type, headers=entry.headers)
+
+    def put(self, user_id: int, url: str, version: int, response: Response):
+        if len(response.body) > self.max_bytes:
+            return
+        key = (user_id, url)
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in ("content-length", "content-type")}
+        entry = CachedResponse(version=version, body=response.body, media_type=response.media_type, headers=headers)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = entry
+            self._by_user.setdefault(user_id, set()).add(key)
+            self._bytes += len(entry.body)
+            while self._bytes > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._drop(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,113 @@
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "60"))
+
+# text-embedding-3-* and gpt-4o-mini tokenizers
+EMBEDDING_ENCODING = "cl100k_base"
+
+
+# --------------------------------------------------
+# TOKENIZER
+# --------------------------------------------------
+# tiktoken is optional and downloads its BPE files on first use (a
+# blocking HTTP call), so the app preloads its encodings at startup with
+# load_encodings() off the event loop. Without it (or offline) tokens are
+# estimated from word pieces, which is close enough for budgeting.
+
+_encodings: dict = {}
+_encodings_lock = threading.Lock()
+_WORD_PIECES = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def get_encoding(name: str = EMBEDDING_ENCODING):
+    with _encodings_lock:
+        if name not in _encodings:
+            try:
+                import tiktoken
+                _encodings[name] = tiktoken.get_encoding(name)
+            except Exception as e:
+                logger.warning("tiktoken encoding %s unavailable, estimating tokens: %s", name, e)
+                _encodings[name] = None
+        return _encodings[name]
+
+
+def load_encodings(*names: str):
+    for name in names:
+        get_encoding(name)
+
+
+def count_tokens(text: str, encoding_name: str = EMBEDDING_ENCODING) -> int:
+    encoding = get_encoding(encoding_name)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(_WORD_PIECES.findall(text))
+
+
+def truncate_tokens(text: str, max_tokens: int, encoding_name: str = EMBEDDING_ENCODING) -> str:
+    spans = _token_spans(text, get_encoding(encoding_name))
+    if len(spans) <= max_tokens:
+        return text
+    return text[:spans[max_tokens - 1][1]] if max_tokens > 0 else ""
+
+
+def _token_spans(text: str, encoding) -> list[tuple[int, int]]:
+    # (start, end) character offsets of every token in text
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        decoded, offsets = encoding.decode_with_offsets(tokens)
+        if decoded == text:
+            ends = offsets[1:] + [len(text)]
+            return list(zip(offsets, ends))
+    return [m.span() for m in _WORD_PIECES.finditer(text)]
+
+
+# --------------------------------------------------
+# CHUNKING
+# --------------------------------------------------
+
+@dataclass
+class Chunk:
+    index: int
+    text: str
+    start: int
+    end: int
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int = CHUNK_TOKENS,
+    overlap: int = CHUNK_OVERLAP_TOKENS,
+    encoding_name: Optional[str] = EMBEDDING_ENCODING
+) -> list[Chunk]:
+    # Sliding token windows with overlap. Offsets index into the original
+    # text so a chunk can be re-cut from the note without storing it.
+    spans = _token_spans(text, get_encoding(encoding_name))
+    if len(spans) <= max_tokens:
+        return [Chunk(index=0, text=text, start=0, end=len(text))]
+
+    step = max(max_tokens - overlap, 1)
+    chunks = []
+    for first in range(0, len(spans), step):
+        last = min(first + max_tokens, len(spans)) - 1
+        start = spans[first][0] if first else 0
+        end = spans[last][1] if last < len(spans) - 1 else len(text)
+        chunks.append(Chunk(index=len(chunks), text=text[start:end], start=start, end=end))
+        if last == len(spans) - 1:
+            break
+    return chunks
@@ -0,0 +1,79 @@
+import argparse
+
+from app.database.database import engine
+from app.database.migrations import run_migrations
+from app.models import models
+from app.vectorstore.vectorstore import VECTOR_BACKEND, INDEX_NAME, pinecone_api_key, provision_pinecone_index
+
+
+# --------------------------------------------------
+# COMMANDS
+# --------------------------------------------------
+
+def init_db(args):
+    models.Base.metadata.create_all(bind=engine)
+    print("Tables created")
+    migrate(args)
+
+
+def migrate(args):
+    applied = run_migrations(engine)
+    print(f"Applied migrations: {', '.join(applied)}" if applied else "Schema is up to date")
+
+
+def reconcile_vectors(args):
+    # Queues repairs in the outbox; the running app's indexer applies them
+    from app.indexing.indexing import reconcile
+
+    if VECTOR_BACKEND == "local":
+        # This process' store is empty, so every note would look missing
+        raise SystemExit(
+            "VECTOR_BACKEND=local keeps vectors inside the app process; "
+            "it reconciles its own store at startup and every RECONCILE_INTERVAL seconds"
+        )
+
+    result = reconcile(batch_size=args.batch_size)
+    if result.get("skipped"):
+        print("Another reconcile is running")
+        return
+    print(f"Queued {result['orphans']} orphan deletes, {result['missing']} missing notes, {result['retried']} retries")
+
+
+def reindex_vectors(args):
+    from app.indexing.indexing import reindex_all
+
+    queued = reindex_all(batch_size=args.batch_size)
+    print(f"Queued {queued} notes for re-indexing")
+
+
+def create_index(args):
+    if VECTOR_BACKEND != "pinecone":
+        print(f"VECTOR_BACKEND={VECTOR_BACKEND}, nothing to provision")
+        return
+
+    created = provision_pinecone_index(pinecone_api_key())
+    print(f"Index {INDEX_NAME} {'created' if created else 'already exists'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Notes API admin tasks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("init-db", help="Create database tables").set_defaults(func=init_db)
+    commands.add_parser("migrate", help="Apply pending schema migrations").set_defaults(func=migrate)
+    commands.add_parser("create-index", help="Create the Pinecone index if missing").set_defaults(func=create_index)
+
+    reconcile_parser = commands.add_parser("reconcile", help="Repair drift between SQL notes and vectors")
+    reconcile_parser.add_argument("--batch-size", type=int, default=1000)
+    reconcile_parser.set_defaults(func=reconcile_vectors)
+
+    reindex_parser = commands.add_parser("reindex", help="Re-embed and re-upsert every note")
+    reindex_parser.add_argument("--batch-size", type=int, default=1000)
+    reindex_parser.set_defaults(func=reindex_vectors)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import os
+from typing import Optional
+
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, OpenAI
+
+from ..vectorstore.vectorstore import InstrumentedVectorStore, VectorStore, create_vector_store
+
+load_dotenv()
+
+# --------------------------------------------------
+# SHARED UPSTREAM CLIENTS
+# --------------------------------------------------
+# Created once per worker by the app lifespan (init_clients). The getters
+# also create them on first use so the CLI and background threads work
+# without the web app. Nothing here touches the network at import time.
+
+_openai: Optional[OpenAI] = None
+_async_openai: Optional[AsyncOpenAI] = None
+_vector_store: Optional[VectorStore] = None
+
+
+def _openai_api_key() -> str:
+    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    if not OPENAI_API_KEY:
+        raise ValueError("Missing OPENAI_API_KEY")
+    return OPENAI_API_KEY
+
+
+def get_openai() -> OpenAI:
+    global _openai
+    if _openai is None:
+        _openai = OpenAI(api_key=_openai_api_key())
+    return _openai
+
+
+def get_async_openai() -> AsyncOpenAI:
+    global _async_openai
+    if _async_openai is None:
+        _async_openai = AsyncOpenAI(api_key=_openai_api_key())
+    return _async_openai
+
+
+def get_vector_store() -> VectorStore:
+    global _vector_store
+    if _vector_store is None:
+        _vector_store = InstrumentedVectorStore(create_vector_store())
+    return _vector_store
+
+
+def set_vector_store(store: VectorStore):
+    # For benchmarks/tests that bring their own backend
+    global _vector_store
+    _vector_store = InstrumentedVectorStore(store)
+
+
+def init_clients():
+    get_openai()
+    get_async_openai()
+    get_vector_store()
+
+
+async def close_clients():
+    global _openai, _async_openai
+    if _async_openai is not None:
+        await _async_openai.close()
+        _async_openai = None
+    if _openai is not None:
+        _openai.close()
+        _openai = None
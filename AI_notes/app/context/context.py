@@ -0,0 +1,190 @@
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from ..chunking.chunking import count_tokens, truncate_tokens
+from ..embeddings.embeddings import normalize_text
+
+load_dotenv()
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
+
+# Tokenizer of CHAT_MODEL (gpt-4o family)
+CHAT_ENCODING = os.getenv("CHAT_ENCODING", "o200k_base")
+
+# Chunks fetched per question and the token budget the context must fit in
+CONTEXT_TOP_K = int(os.getenv("CONTEXT_TOP_K", "8"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+# Decisions recorded per match
+INCLUDED = "included"
+TRIMMED = "trimmed"        # overlap with an included chunk removed
+TRUNCATED = "truncated"    # cut to fit the budget
+DUPLICATE = "duplicate"
+OVER_BUDGET = "over_budget"
+NO_TEXT = "no_text"
+
+
+@dataclass
+class ContextDecision:
+    id: str
+    note_id: int
+    score: float
+    tokens: int
+    decision: str
+
+
+@dataclass
+class _Piece:
+    note_id: int
+    start: Optional[int]
+    end: Optional[int]
+    text: str
+
+
+@dataclass
+class BuiltContext:
+    text: str
+    note_ids: list[int]
+    tokens: int
+    budget: int
+    decisions: list[ContextDecision] = field(default_factory=list)
+
+    @property
+    def truncated(self) -> bool:
+        return any(d.decision in (TRUNCATED, OVER_BUDGET) for d in self.decisions)
+
+    def summary(self) -> dict:
+        return {
+            "budget": self.budget,
+            "tokens": self.tokens,
+            "truncated": self.truncated,
+            "chunks": [
+                {"id": d.id, "note_id": d.note_id, "score": round(d.score, 4), "tokens": d.tokens, "decision": d.decision}
+                for d in self.decisions
+            ]
+        }
+
+
+# --------------------------------------------------
+# HELPERS
+# --------------------------------------------------
+
+def match_note_id(match) -> int:
+    # Pinecone returns numeric metadata as floats; pre-chunking vectors
+    # only carry the id in the vector id ("note-<id>")
+    note_id = match.metadata.get("note_id")
+    return int(note_id) if note_id is not None else int(match.id.split("-")[1])
+
+
+def match_span(match) -> tuple[Optional[int], Optional[int]]:
+    start, end = match.metadata.get("start"), match.metadata.get("end")
+    if start is None or end is None:
+        return None, None
+    return int(start), int(end)
+
+
+def _uncovered(start: int, end: int, covered: list[tuple[int, int]]) -> tuple[int, int]:
+    # Shrinks [start, end) past any already-included span overlapping its
+    # head or tail; chunks of one note only ever overlap at the edges
+    for c_start, c_end in covered:
+        if c_start <= start < c_end:
+            start = c_end
+        if c_start < end <= c_end:
+            end = c_start
+    return start, max(start, end)
+
+
+# --------------------------------------------------
+# BUILDER
+# --------------------------------------------------
+
+def build_context(
+    matches,
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    encoding_name: str = CHAT_ENCODING
+) -> BuiltContext:
+    # 1️⃣ Best matches first
+    ranked = sorted(matches, key=lambda m: m.score, reverse=True)
+
+    pieces: list[_Piece] = []
+    decisions: list[ContextDecision] = []
+    seen_texts: set[str] = set()
+    covered: dict[int, list[tuple[int, int]]] = {}
+    used = 0
+
+    for match in ranked:
+        note_id = match_note_id(match)
+        text = match.metadata.get("text") or ""
+
+        def decide(decision: str, tokens: int = 0):
+            decisions.append(ContextDecision(id=match.id, note_id=note_id, score=match.score, tokens=tokens, decision=decision))
+
+        if not text.strip():
+            decide(NO_TEXT)
+            continue
+
+        # 2️⃣ Dedupe: identical text anywhere, overlapping windows of one note
+        key = normalize_text(text).casefold()
+        if key in seen_texts:
+            decide(DUPLICATE)
+            continue
+
+        decision = INCLUDED
+        start, end = match_span(match)
+        if start is not None:
+            new_start, new_end = _uncovered(start, end, covered.get(note_id, []))
+            if new_end <= new_start:
+                decide(DUPLICATE)
+                continue
+            if (new_start, new_end) != (start, end):
+                text = text[new_start - start:new_end - start]
+                start, end = new_start, new_end
+                decision = TRIMMED
+
+        # 3️⃣ Fill the budget; the best chunk is cut down rather than dropped
+        tokens = count_tokens(text, encoding_name)
+        if used + tokens > budget:
+            if pieces:
+                decide(OVER_BUDGET, tokens)
+                continue
+            text = truncate_tokens(text, budget, encoding_name)
+            tokens = count_tokens(text, encoding_name)
+            end = start + len(text) if start is not None else None
+            decision = TRUNCATED
+
+        seen_texts.add(key)
+        if start is not None:
+            covered.setdefault(note_id, []).append((start, end))
+        pieces.append(_Piece(note_id=note_id, start=start, end=end, text=text))
+        used += tokens
+        decide(decision, tokens)
+
+    # 4️⃣ Group by note (best note first) and restore reading order inside a note
+    note_ids = list(dict.fromkeys(piece.note_id for piece in pieces))
+    rank = {note_id: i for i, note_id in enumerate(note_ids)}
+    pieces.sort(key=lambda p: (rank[p.note_id], p.start if p.start is not None else 0))
+
+    # Windows that now touch end to start are one passage again
+    merged: list[_Piece] = []
+    for piece in pieces:
+        previous = merged[-1] if merged else None
+        if previous and previous.note_id == piece.note_id and previous.end is not None and previous.end == piece.start:
+            previous.text += piece.text
+            previous.end = piece.end
+        else:
+            merged.append(piece)
+
+    return BuiltContext(
+        text="\n\n".join(piece.text for piece in merged),
+        note_ids=note_ids,
+        tokens=used,
+        budget=budget,
+        decisions=decisions
+    )
@@ -1,8 +1,18 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
 from dotenv import load_dotenv
 import os
-from pinecone import Pinecone, ServerlessSpec
+import asyncio
+import logging
+import time
+import uuid
+from sqlalchemy import event, text
+from .pool import TimedQueuePool, TimedAsyncAdaptedQueuePool
+from ..metrics.metrics import SQL, STAGE_ERRORS, record_stage
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
@@ -14,7 +24,56 @@ SQLALCHEMY_DATABASE_URL = os.getenv("SQLALCHEMY_DATABASE_URL")
 if not SQLALCHEMY_DATABASE_URL:
     raise ValueError("Missing SQLALCHEMY_DATABASE_URL")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# -------------------------
+# Pool settings (per engine, per worker process)
+# -------------------------
+# Each worker has a sync and an async engine, so the database sees up to
+# workers * 2 * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+# DB_POOL_SIZE=0 disables app-side pooling (NullPool), e.g. behind PgBouncer.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# SQLAlchemy's compiled-statement cache and asyncpg's prepared-statement cache
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "500"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+# PgBouncer in transaction mode can't keep named prepared statements across
+# transactions, so server-side statement caching is turned off
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() in ("1", "true", "yes")
+
+
+def pool_options(async_pool: bool) -> dict:
+    if DB_POOL_SIZE <= 0:
+        return {"poolclass": NullPool, "pool_pre_ping": DB_POOL_PRE_PING}
+    return {
+        "poolclass": TimedAsyncAdaptedQueuePool if async_pool else TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def asyncpg_connect_args() -> dict:
+    if DB_PGBOUNCER:
+        return {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            # Unique names so statements never collide on a shared server connection
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    return {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    query_cache_size=DB_QUERY_CACHE_SIZE,
+    **pool_options(async_pool=False)
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -26,30 +85,85 @@ def get_db():
         db.close()
 
 # -------------------------
-# Pinecone setup
+# Async SQLAlchemy setup (used by request handlers on the event loop)
+# -------------------------
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+SQLALCHEMY_ASYNC_DATABASE_URL = os.getenv("SQLALCHEMY_ASYNC_DATABASE_URL") or to_async_url(SQLALCHEMY_DATABASE_URL)
+
+async_engine = create_async_engine(
+    SQLALCHEMY_ASYNC_DATABASE_URL,
+    query_cache_size=DB_QUERY_CACHE_SIZE,
+    connect_args=asyncpg_connect_args() if "+asyncpg" in SQLALCHEMY_ASYNC_DATABASE_URL else {},
+    **pool_options(async_pool=True)
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# -------------------------
+# SQL timing (per statement, both engines)
 # -------------------------
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-if not PINECONE_API_KEY:
-    raise ValueError("Missing PINECONE_API_KEY")
 
-pc = Pinecone(api_key=PINECONE_API_KEY)
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    record_stage(SQL, time.perf_counter() - conn.info["query_started"].pop())
+
+
+def _handle_error(exception_context):
+    STAGE_ERRORS.labels(SQL).inc()
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(_engine, "handle_error", _handle_error)
+
+# -------------------------
+# Readiness check (called from the app lifespan)
+# -------------------------
+DB_CONNECT_RETRIES = int(os.getenv("DB_CONNECT_RETRIES", "5"))
+DB_CONNECT_BACKOFF = float(os.getenv("DB_CONNECT_BACKOFF", "0.5"))
 
-INDEX_NAME = "notes-api"
-EMBEDDING_DIMENSION = 1536  # example: OpenAI text-embedding-3-small
 
-# Check if index exists, else create
-existing_indexes = [index["name"] for index in pc.list_indexes()]
+async def wait_for_database(retries: int = DB_CONNECT_RETRIES, backoff: float = DB_CONNECT_BACKOFF):
+    for attempt in range(1, retries + 1):
+        try:
+            async with async_engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+            logger.info("Database connected successfully")
+            return
+        except Exception as error:
+            if attempt == retries:
+                raise
+            delay = min(backoff * 2 ** (attempt - 1), 10)
+            logger.warning("Database connection failed (attempt %d/%d): %s", attempt, retries, error)
+            await asyncio.sleep(delay)
 
-if INDEX_NAME not in existing_indexes:
-    pc.create_index(
-        name=INDEX_NAME,
-        dimension=EMBEDDING_DIMENSION,
-        metric="cosine",
-        spec=ServerlessSpec(
-            cloud="aws",
-            region="us-east-1"
-        )
-    )
 
-# Get index reference
-pinecone_index = pc.Index(INDEX_NAME)
+def pool_stats() -> dict:
+    # Checkout wait, in-use and overflow counts for sizing the pools
+    stats = {}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.pool)):
+        timed = getattr(pool, "stats", None)
+        stats[name] = timed.snapshot(pool) if timed else {"pool": type(pool).__name__}
+    return stats
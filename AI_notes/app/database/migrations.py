@@ -0,0 +1,98 @@
+import re
+
+from sqlalchemy import text
+
+from ..models.models import NOTES_SEARCH_EXPRESSION
+
+# --------------------------------------------------
+# MIGRATIONS
+# --------------------------------------------------
+# Ordered (version, statements). init-db creates new databases straight
+# from the models, so every statement must also be a no-op there.
+# A migration with a CONCURRENTLY statement can't run in a transaction:
+# its statements run one by one in autocommit, so each must be idempotent.
+
+MIGRATIONS = [
+    # Maintenance window: adding a STORED generated column rewrites notes
+    # under an ACCESS EXCLUSIVE lock, so reads and writes of notes wait for
+    # the whole table. The GIN build after it doesn't block writes.
+    ("0001_notes_search_vector", [
+        f"ALTER TABLE notes ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS ({NOTES_SEARCH_EXPRESSION}) STORED",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_notes_search_vector ON notes USING gin (search_vector)",
+    ]),
+    ("0002_index_outbox", [
+        "CREATE TABLE IF NOT EXISTS index_outbox ("
+        "id BIGSERIAL PRIMARY KEY, "
+        "op VARCHAR NOT NULL, "
+        "note_id INTEGER, "
+        "user_id INTEGER, "
+        "create_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(), "
+        "available_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(), "
+        "attempts INTEGER NOT NULL DEFAULT 0, "
+        "last_error VARCHAR)",
+        "CREATE INDEX IF NOT EXISTS ix_index_outbox_note_id ON index_outbox (note_id)",
+    ]),
+    ("0003_user_deletion", [
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITH TIME ZONE",
+        "CREATE TABLE IF NOT EXISTS user_deletions ("
+        "user_id INTEGER PRIMARY KEY, "
+        "requested_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(), "
+        "notes_purged INTEGER NOT NULL DEFAULT 0, "
+        "finished_at TIMESTAMP WITH TIME ZONE)",
+    ]),
+    ("0004_access_path_indexes", [
+        # Built without blocking writes to notes and users
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_notes_user_id_create_at_id ON notes (user_id, create_at, id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_notes_create_at_id ON notes (create_at, id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_live_create_at_id ON users (create_at, id) WHERE deleted_at IS NULL",
+    ]),
+    ("0005_users_notes_version", [
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS notes_version BIGINT NOT NULL DEFAULT 0",
+    ]),
+]
+
+
+_CONCURRENT_INDEX = re.compile(r"CREATE INDEX CONCURRENTLY IF NOT EXISTS (\w+)")
+
+
+def _drop_invalid_index(conn, statement: str):
+    # A failed concurrent build leaves an INVALID index behind, which
+    # IF NOT EXISTS would then take as done
+    match = _CONCURRENT_INDEX.match(statement)
+    if match and conn.execute(text(
+        "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+        "WHERE pg_class.relname = :name AND NOT pg_index.indisvalid"
+    ), {"name": match.group(1)}).first():
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}"))
+
+
+def run_migrations(engine) -> list[str]:
+    # Returns the versions applied by this run
+    applied = []
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version VARCHAR PRIMARY KEY, "
+            "applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW())"
+        ))
+        done = set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+
+    for version, statements in MIGRATIONS:
+        if version in done:
+            continue
+        if any("CONCURRENTLY" in statement for statement in statements):
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                for statement in statements:
+                    _drop_invalid_index(conn, statement)
+                    conn.execute(text(statement))
+                conn.execute(text("INSERT INTO schema_migrations (version) VALUES (:v)"), {"v": version})
+            applied.append(version)
+            continue
+        # One transaction per migration so a failure leaves earlier ones applied
+        with engine.begin() as conn:
+            for statement in statements:
+                conn.execute(text(statement))
+            conn.execute(text("INSERT INTO schema_migrations (version) VALUES (:v)"), {"v": version})
+        applied.append(version)
+    return applied
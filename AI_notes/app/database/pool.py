@@ -0,0 +1,109 @@
+import logging
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# SQLAlchemy names pool loggers after the pool class's module, so these
+# subclasses would otherwise log dispose/recreate chatter at INFO
+logging.getLogger(__name__).setLevel(logging.WARNING)
+
+# --------------------------------------------------
+# POOL METRICS
+# --------------------------------------------------
+# QueuePool has no "checkout started" event, so checkout time (waiting for
+# a free slot, opening overflow connections, pre-ping) is measured by
+# wrapping Pool.connect in a small subclass.
+
+
+class PoolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.overflow_opened = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, waited: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def record_overflow(self):
+        with self._lock:
+            self.overflow_opened += 1
+
+    def record_timeout(self, waited: float):
+        with self._lock:
+            self.timeouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            checkouts = self.checkouts
+            stats = {
+                "checkouts": checkouts,
+                "overflow_opened": self.overflow_opened,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_avg": round(self.wait_seconds_total / checkouts, 6) if checkouts else 0.0,
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+            }
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "in_use": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+            })
+        return stats
+
+
+class _TimedMixin:
+    stats: PoolStats
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            self.stats.record_timeout(time.perf_counter() - started)
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return connection
+
+    def _inc_overflow(self):
+        # QueuePool's counter starts at -pool_size; above zero the new
+        # connection is an overflow one
+        allowed = super()._inc_overflow()
+        if allowed and self._overflow > 0:
+            self.stats.record_overflow()
+        return allowed
+
+
+class TimedQueuePool(_TimedMixin, QueuePool):
+    def __init__(self, *args, **kwargs):
+        self.stats = PoolStats()
+        super().__init__(*args, **kwargs)
+
+    def recreate(self):
+        # Keep the counters when SQLAlchemy rebuilds the pool (e.g. dispose)
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class TimedAsyncAdaptedQueuePool(_TimedMixin, AsyncAdaptedQueuePool):
+    def __init__(self, *args, **kwargs):
+        self.stats = PoolStats()
+        super().__init__(*args, **kwargs)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
@@ -0,0 +1,346 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, OpenAI
+
+from ..clients.clients import get_async_openai, get_openai
+from ..metrics.metrics import EMBED, timed
+
+load_dotenv()
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# In-memory tier budget (bytes of float32 vectors + keys)
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Optional on-disk tier; unset to keep the cache memory-only
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+
+# OpenAI limits per embeddings request: 2048 inputs and ~300k tokens total.
+# Tokens are estimated at ~4 chars each, with some headroom.
+EMBEDDING_MAX_BATCH_INPUTS = int(os.getenv("EMBEDDING_MAX_BATCH_INPUTS", "2048"))
+EMBEDDING_MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "250000"))
+
+
+# --------------------------------------------------
+# KEYS
+# --------------------------------------------------
+
+_WHITESPACE = re.compile(r"[ \t]+")
+
+
+def normalize_text(text: str) -> str:
+    # Whitespace-only edits shouldn't cost a new embedding
+    text = unicodedata.normalize("NFC", text)
+    lines = (_WHITESPACE.sub(" ", line).strip() for line in text.splitlines())
+    return "\n".join(lines).strip()
+
+
+def cache_key(model: str, normalized_text: str) -> str:
+    digest = hashlib.sha256(normalized_text.encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+# --------------------------------------------------
+# CACHE
+# --------------------------------------------------
+
+class EmbeddingCache:
+    def __init__(self, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES, path: Optional[str] = EMBEDDING_CACHE_PATH):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._disk: Optional[sqlite3.Connection] = None
+        if path:
+            self._disk = sqlite3.connect(path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._disk.commit()
+
+    @property
+    def persistent(self) -> bool:
+        return self._disk is not None
+
+    @staticmethod
+    def _size(key: str, vector: np.ndarray) -> int:
+        return vector.nbytes + len(key)
+
+    def _remember(self, key: str, vector: np.ndarray):
+        # Caller holds the lock
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        self._entries[key] = vector
+        self._bytes += self._size(key, vector)
+        while self._bytes > self.max_bytes and self._entries:
+            old_key, old_vector = self._entries.popitem(last=False)
+            self._bytes -= self._size(old_key, old_vector)
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT vector FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    (key, vector.tobytes())
+                )
+                self._disk.commit()
+        return vector
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "persistent": self._disk is not None,
+            }
+
+
+# --------------------------------------------------
+# EMBEDDER
+# --------------------------------------------------
+
+class Embedder:
+    def __init__(
+        self,
+        cache: EmbeddingCache,
+        client: Optional[OpenAI] = None,
+        async_client: Optional[AsyncOpenAI] = None,
+        model: str = EMBEDDING_MODEL
+    ):
+        # Without explicit clients the shared ones from app.clients are used
+        self._client = client
+        self._async_client = async_client
+        self.cache = cache
+        self.model = model
+        self._lock = threading.Lock()
+
+        # cache key -> result of a request another caller has in flight, so
+        # identical texts embedded concurrently (request handlers and the
+        # indexer thread alike) share one API call
+        self._in_flight: dict[str, Future] = {}
+        self.coalesced = 0
+
+        # Used to estimate what the cache saves
+        self.api_calls = 0
+        self.api_seconds = 0.0
+        self.embedded_texts = 0
+        self.saved_chars = 0
+
+    @property
+    def client(self) -> OpenAI:
+        return self._client or get_openai()
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        return self._async_client or get_async_openai()
+
+    # ---------- shared steps ----------
+
+    def _lookup(self, texts: list[str]):
+        # The normalized text only keys the cache; the API gets the text as
+        # given (a whitespace-only text normalizes to "", which it rejects)
+        keys = [cache_key(self.model, normalize_text(t)) for t in texts]
+
+        vectors: dict[str, np.ndarray] = {}
+        missing: dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key in vectors or key in missing:
+                continue
+            vector = self.cache.get(key)
+            if vector is not None:
+                vectors[key] = vector
+                with self._lock:
+                    self.saved_chars += len(text)
+            else:
+                missing[key] = text
+        return keys, vectors, missing
+
+    def _claim(self, missing: dict):
+        # Returns (keys this caller embeds, keys it waits for) as key -> Future
+        claimed, waiting = {}, {}
+        with self._lock:
+            for key in missing:
+                future = self._in_flight.get(key)
+                if future is None:
+                    claimed[key] = self._in_flight[key] = Future()
+                else:
+                    waiting[key] = future
+                    self.coalesced += 1
+        return claimed, waiting
+
+    def _settle(self, claimed: dict, vectors: dict, error: Optional[BaseException] = None):
+        with self._lock:
+            for key, future in claimed.items():
+                if self._in_flight.get(key) is future:
+                    del self._in_flight[key]
+        for key, future in claimed.items():
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(vectors[key])
+            else:
+                future.set_exception(error if isinstance(error, Exception) else RuntimeError("embedding request was cancelled"))
+
+    @staticmethod
+    def _request_batches(missing: dict):
+        # Split cache misses into requests that fit the API's limits
+        batch, tokens = {}, 0
+        for key, text in missing.items():
+            estimate = len(text) // 4 + 1
+            if batch and (len(batch) >= EMBEDDING_MAX_BATCH_INPUTS or tokens + estimate > EMBEDDING_MAX_BATCH_TOKENS):
+                yield batch
+                batch, tokens = {}, 0
+            batch[key] = text
+            tokens += estimate
+        if batch:
+            yield batch
+
+    def _store(self, vectors: dict, missing: dict, response, elapsed: float):
+        with self._lock:
+            self.api_calls += 1
+            self.api_seconds += elapsed
+            self.embedded_texts += len(missing)
+
+        for key, item in zip(missing, response.data):
+            vectors[key] = self.cache.put(key, item.embedding)
+
+    # ---------- sync (background workers) ----------
+
+    def embed(self, text: str) -> list[float]:
+        return self.embed_many([text])[0]
+
+    def embed_many(self, texts: list[str]) -> list[list[float]]:
+        keys, vectors, missing = self._lookup(texts)
+        claimed, waiting = self._claim(missing)
+
+        # One API call per API-sized batch of texts not already cached
+        try:
+            for batch in self._request_batches({key: missing[key] for key in claimed}):
+                started = time.perf_counter()
+                with timed(EMBED):
+                    response = self.client.embeddings.create(
+                        model=self.model,
+                        input=list(batch.values())
+                    )
+                self._store(vectors, batch, response, time.perf_counter() - started)
+                self._settle({key: claimed[key] for key in batch}, vectors)
+        except BaseException as e:
+            self._settle(claimed, vectors, e)
+            raise
+
+        for key, future in waiting.items():
+            vectors[key] = future.result()
+
+        return [vectors[key].tolist() for key in keys]
+
+    # ---------- async (request handlers) ----------
+
+    async def aembed(self, text: str) -> list[float]:
+        return (await self.aembed_many([text]))[0]
+
+    async def aembed_many(self, texts: list[str]) -> list[list[float]]:
+        # The disk tier is SQLite, so keep it off the event loop
+        if self.cache.persistent:
+            keys, vectors, missing = await asyncio.to_thread(self._lookup, texts)
+        else:
+            keys, vectors, missing = self._lookup(texts)
+        claimed, waiting = self._claim(missing)
+
+        try:
+            for batch in self._request_batches({key: missing[key] for key in claimed}):
+                started = time.perf_counter()
+                with timed(EMBED):
+                    response = await self.async_client.embeddings.create(
+                        model=self.model,
+                        input=list(batch.values())
+                    )
+                elapsed = time.perf_counter() - started
+                if self.cache.persistent:
+                    await asyncio.to_thread(self._store, vectors, batch, response, elapsed)
+                else:
+                    self._store(vectors, batch, response, elapsed)
+                self._settle({key: claimed[key] for key in batch}, vectors)
+        except BaseException as e:
+            self._settle(claimed, vectors, e)
+            raise
+
+        for key, future in waiting.items():
+            vectors[key] = await asyncio.wrap_future(future)
+
+        return [vectors[key].tolist() for key in keys]
+
+    def stats(self) -> dict:
+        stats = self.cache.stats()
+        with self._lock:
+            per_text = self.api_seconds / self.embedded_texts if self.embedded_texts else 0.0
+            hits = stats["memory_hits"] + stats["disk_hits"]
+            stats.update({
+                "api_calls": self.api_calls,
+                "coalesced": self.coalesced,
+                "api_seconds": round(self.api_seconds, 3),
+                "embedded_texts": self.embedded_texts,
+                # Rough: hits x average API latency per text, ~4 chars per token
+                "estimated_seconds_saved": round(hits * per_text, 3),
+                "estimated_tokens_saved": self.saved_chars // 4,
+            })
+        return stats
+
+
+embedding_cache = EmbeddingCache()
+embedder = Embedder(embedding_cache)
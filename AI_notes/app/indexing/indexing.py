@@ -0,0 +1,660 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+
+import openai
+from dotenv import load_dotenv
+from sqlalchemy import and_, delete, exists, func, insert, literal, or_, select, text, update
+from sqlalchemy.orm import aliased
+
+from ..chunking.chunking import chunk_text
+from ..clients.clients import get_vector_store
+from ..database.database import SessionLocal, engine
+from ..embeddings.embeddings import embedder
+from ..models import models
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+
+# Up to INDEX_BATCH_SIZE outbox rows are claimed per round; after a wake-up
+# the worker waits INDEX_BATCH_WINDOW seconds so bursts share one
+# embeddings call. The embedder splits batches that exceed API limits.
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "256"))
+INDEX_BATCH_WINDOW = float(os.getenv("INDEX_BATCH_WINDOW", "0.5"))
+INDEX_POLL_INTERVAL = float(os.getenv("INDEX_POLL_INTERVAL", "2"))
+
+# Rows that failed this many times stay in the outbox as "failed" until a
+# newer change for the note supersedes them or the reconciler re-arms them
+INDEX_MAX_RETRIES = int(os.getenv("INDEX_MAX_RETRIES", "5"))
+
+# A claimed row becomes visible again after this long, so a worker that
+# crashed mid-batch does not lose it
+INDEX_LEASE_SECONDS = int(os.getenv("INDEX_LEASE_SECONDS", "120"))
+
+# Seconds between reconciler runs (0 disables the periodic run)
+RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", "3600"))
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "1000"))
+
+# Only one worker process reconciles at a time
+RECONCILE_LOCK_KEY = 72_001
+
+# Held for the life of the one process serving VECTOR_BACKEND=local
+LOCAL_STORE_LOCK_KEY = 72_002
+
+# Serializes outbox claims, so each claim sees the leases before it
+CLAIM_LOCK_KEY = 72_003
+
+# Account purges delete this many notes (and their vectors) per SQL
+# transaction, and run at most USER_PURGE_BATCHES_PER_ROUND batches before
+# yielding the worker to other outbox rows
+USER_PURGE_BATCH_SIZE = int(os.getenv("USER_PURGE_BATCH_SIZE", "500"))
+USER_PURGE_BATCHES_PER_ROUND = int(os.getenv("USER_PURGE_BATCHES_PER_ROUND", "10"))
+
+# Failures of the service rather than of a note; retrying the same batch
+# later is the only remedy
+UPSTREAM_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+# Outbox operations
+CREATE = "create"
+UPDATE = "update"
+DELETE = "delete"
+DELETE_USER = "delete_user"
+
+PENDING = "pending"
+INDEXED = "indexed"
+FAILED = "failed"
+PURGING = "purging"
+DONE = "done"
+
+
+@dataclass
+class IndexState:
+    status: str
+    updated_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class DeletionState:
+    user_id: int
+    status: str
+    requested_at: datetime
+    notes_purged: int
+    notes_remaining: int
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+
+# --------------------------------------------------
+# VECTOR IDS
+# --------------------------------------------------
+# Each note is stored as chunks "note-<id>-<n>". Notes indexed before
+# chunking have a single "note-<id>" vector, which cleanup also removes.
+
+def chunk_vector_id(note_id: int, chunk: int) -> str:
+    return f"note-{note_id}-{chunk}"
+
+
+def note_vector_prefix(note_id: int) -> str:
+    return f"note-{note_id}-"
+
+
+def note_id_from_vector_id(vector_id: str) -> Optional[int]:
+    parts = vector_id.split("-")
+    if len(parts) < 2 or parts[0] != "note" or not parts[1].isdigit():
+        return None
+    return int(parts[1])
+
+
+def note_text(title: str, content: str) -> str:
+    # The text that gets chunked; chunk start/end metadata are offsets into it
+    return f"{title}\n{content}"
+
+
+def note_vector_ids(note_id: int, title: str, content: str) -> list[str]:
+    # Ids the note's current text chunks to, plus the pre-chunking id.
+    # Chunks of an older, longer version are left to the reconciler.
+    chunks = chunk_text(note_text(title, content))
+    return [f"note-{note_id}"] + [chunk_vector_id(note_id, chunk.index) for chunk in chunks]
+
+
+def delete_note_vectors(note_id: int, keep: Optional[set] = None):
+    store = get_vector_store()
+    store.delete(ids=[f"note-{note_id}"])
+    store.delete_prefix(note_vector_prefix(note_id), keep=keep)
+
+
+# --------------------------------------------------
+# OUTBOX (producer side, inside the caller's transaction)
+# --------------------------------------------------
+
+def add_outbox(db, op: str, note_id: Optional[int] = None, user_id: Optional[int] = None):
+    # Works with both Session and AsyncSession; committed with the note change
+    db.add(models.IndexOutbox(op=op, note_id=note_id, user_id=user_id))
+
+
+def outbox_rows(op: str, notes) -> list[dict]:
+    # Parameters for one multi-row insert(models.IndexOutbox)
+    return [{"op": op, "note_id": note.id, "user_id": note.user_id} for note in notes]
+
+
+async def index_status(db, note_id: int) -> IndexState:
+    # No outbox row left means every change to the note has been applied
+    row = (await db.execute(
+        select(models.IndexOutbox.attempts, models.IndexOutbox.last_error, models.IndexOutbox.create_at)
+        .where(models.IndexOutbox.note_id == note_id)
+        .order_by(models.IndexOutbox.id.desc())
+        .limit(1)
+    )).first()
+
+    if row is None:
+        return IndexState(status=INDEXED)
+    status = FAILED if row.attempts >= INDEX_MAX_RETRIES else PENDING
+    return IndexState(status=status, updated_at=row.create_at, error=row.last_error)
+
+
+async def deletion_status(db, user_id: int) -> Optional[DeletionState]:
+    deletion = await db.get(models.UserDeletion, user_id)
+    if deletion is None:
+        return None
+
+    remaining = 0
+    error = None
+    if deletion.finished_at is None:
+        remaining = await db.scalar(select(func.count()).where(models.Notes.user_id == user_id))
+        error = await db.scalar(
+            select(models.IndexOutbox.last_error)
+            .where(models.IndexOutbox.op == DELETE_USER, models.IndexOutbox.user_id == user_id)
+            .order_by(models.IndexOutbox.id.desc())
+            .limit(1)
+        )
+
+    if deletion.finished_at is not None:
+        status = DONE
+    elif deletion.notes_purged:
+        status = PURGING
+    else:
+        status = PENDING
+    return DeletionState(
+        user_id=user_id,
+        status=status,
+        requested_at=deletion.requested_at,
+        notes_purged=deletion.notes_purged,
+        notes_remaining=remaining,
+        finished_at=deletion.finished_at,
+        error=error
+    )
+
+
+# --------------------------------------------------
+# BACKGROUND INDEXER (drains the outbox)
+# --------------------------------------------------
+
+class NoteIndexer:
+    def __init__(self, batch_size: int = INDEX_BATCH_SIZE, batch_window: float = INDEX_BATCH_WINDOW):
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._reconciler: Optional[threading.Thread] = None
+
+    # ---------- lifecycle ----------
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="note-indexer", daemon=True)
+        self._thread.start()
+
+        # A full pass pages through every vector id and note; it gets its own
+        # thread so the outbox keeps draining meanwhile
+        if RECONCILE_INTERVAL:
+            self._reconciler = threading.Thread(target=self._run_reconciler, name="note-reconciler", daemon=True)
+            self._reconciler.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stopping.set()
+        self._wake.set()
+        for thread in (self._thread, self._reconciler):
+            if thread:
+                thread.join(timeout)
+
+    def wake(self):
+        # Called after a commit that added outbox rows; polling alone would
+        # also pick them up, just later
+        self._wake.set()
+
+    # ---------- worker side ----------
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.clear()
+            try:
+                claimed = self._drain_once()
+            except Exception:
+                logger.exception("Outbox drain failed")
+                claimed = 0
+
+            # A full batch means more is probably waiting
+            if claimed < self.batch_size:
+                if self._wake.wait(INDEX_POLL_INTERVAL) and not self._stopping.is_set():
+                    time.sleep(self.batch_window)
+
+    def _run_reconciler(self):
+        while not self._stopping.wait(RECONCILE_INTERVAL):
+            try:
+                reconcile()
+            except Exception:
+                logger.exception("Reconcile failed")
+
+    def _claim(self) -> list:
+        # Lease rows by pushing available_at forward; SKIP LOCKED lets
+        # several workers drain the same table. A note with a row leased
+        # (or backing off) elsewhere is skipped: two workers indexing one
+        # note could land a stale upsert over the fresh one.
+        leased = aliased(models.IndexOutbox)
+        claimable = (
+            select(models.IndexOutbox.id)
+            .where(
+                models.IndexOutbox.available_at <= func.now(),
+                models.IndexOutbox.attempts < INDEX_MAX_RETRIES,
+                ~exists().where(
+                    leased.note_id == models.IndexOutbox.note_id,
+                    leased.available_at > func.now(),
+                    leased.attempts > 0
+                )
+            )
+            .order_by(models.IndexOutbox.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        with SessionLocal() as db:
+            # Claims are one short UPDATE each; taking them in turn keeps two
+            # concurrent claims from both missing the other's lease
+            db.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": CLAIM_LOCK_KEY})
+            rows = db.execute(
+                update(models.IndexOutbox)
+                .where(models.IndexOutbox.id.in_(claimable.scalar_subquery()))
+                .values(
+                    attempts=models.IndexOutbox.attempts + 1,
+                    available_at=func.now() + func.make_interval(0, 0, 0, 0, 0, 0, INDEX_LEASE_SECONDS)
+                )
+                .returning(models.IndexOutbox.id, models.IndexOutbox.op,
+                           models.IndexOutbox.note_id, models.IndexOutbox.user_id,
+                           models.IndexOutbox.attempts)
+            ).all()
+            db.commit()
+        return rows
+
+    def _drain_once(self) -> int:
+        rows = self._claim()
+        if not rows:
+            return 0
+
+        user_rows = [row for row in rows if row.op == DELETE_USER]
+        note_rows = [row for row in rows if row.op != DELETE_USER]
+
+        for row in user_rows:
+            self._purge_user(row)
+
+        if note_rows:
+            self._apply(note_rows)
+        return len(rows)
+
+    def _apply(self, rows: list):
+        # A note the API or the store rejects must not sink the rest of its
+        # batch: split the batch by note until the failure is isolated.
+        # Outages fail every half alike, so those fail the batch at once.
+        try:
+            self._index_notes(rows)
+        except Exception as e:
+            note_ids = sorted({row.note_id for row in rows})
+            if len(note_ids) == 1 or isinstance(e, UPSTREAM_ERRORS):
+                self._fail(rows, e)
+                return
+            first = set(note_ids[:len(note_ids) // 2])
+            self._apply([row for row in rows if row.note_id in first])
+            self._apply([row for row in rows if row.note_id not in first])
+            return
+
+        # Done: drop these rows and anything older for the same notes
+        # (superseded or dead-lettered changes). The cutoff is per note:
+        # ids are assigned at insert, not commit, so a newer row for a note
+        # may still be committing below another note's claimed id.
+        cutoffs: dict[int, int] = {}
+        for row in rows:
+            if row.note_id is not None:
+                cutoffs[row.note_id] = max(row.id, cutoffs.get(row.note_id, 0))
+
+        with SessionLocal() as db:
+            if cutoffs:
+                db.execute(delete(models.IndexOutbox).where(or_(*(
+                    and_(models.IndexOutbox.note_id == note_id, models.IndexOutbox.id <= cutoff)
+                    for note_id, cutoff in cutoffs.items()
+                ))))
+            db.execute(delete(models.IndexOutbox).where(models.IndexOutbox.id.in_([row.id for row in rows])))
+            db.commit()
+
+    def _fail(self, rows: list, error: Exception):
+        logger.warning("Outbox batch of %d rows failed: %s", len(rows), error)
+        with SessionLocal() as db:
+            for row in rows:
+                # Back off so an upstream outage isn't hammered
+                delay = min(2 ** row.attempts, 300)
+                db.execute(
+                    update(models.IndexOutbox)
+                    .where(models.IndexOutbox.id == row.id)
+                    .values(
+                        available_at=func.now() + func.make_interval(0, 0, 0, 0, 0, 0, delay),
+                        last_error=str(error)[:500]
+                    )
+                )
+            db.commit()
+
+    def _purge_user(self, row):
+        # A bounded slice per claim: a huge account neither blocks other
+        # work nor outlives its lease. Progress lives in SQL (the notes
+        # left), so a crash or restart resumes where it stopped.
+        try:
+            done = purge_user(row.user_id, USER_PURGE_BATCHES_PER_ROUND)
+        except Exception as e:
+            self._fail([row], e)
+            return
+
+        with SessionLocal() as db:
+            if done:
+                db.execute(delete(models.IndexOutbox).where(models.IndexOutbox.id == row.id))
+            else:
+                # Progress isn't failure: reset attempts and queue the next slice
+                db.execute(
+                    update(models.IndexOutbox)
+                    .where(models.IndexOutbox.id == row.id)
+                    .values(attempts=0, available_at=func.now(), last_error=None)
+                )
+            db.commit()
+        if not done:
+            self._wake.set()
+
+    def _index_notes(self, rows: list):
+        # The outbox only says which notes changed; the text is always read
+        # from SQL now, so replaying a row is idempotent
+        note_ids = list({row.note_id for row in rows})
+        replace = {row.note_id for row in rows if row.op != CREATE}
+
+        # Notes of accounts being deleted count as gone
+        with SessionLocal() as db:
+            notes = db.execute(
+                select(models.Notes.id, models.Notes.user_id, models.Notes.create_at,
+                       models.Notes.title, models.Notes.content)
+                .join(models.User, models.User.id == models.Notes.user_id)
+                .where(models.Notes.id.in_(note_ids), models.User.deleted_at.is_(None))
+            ).all()
+
+        # 1️⃣ Notes gone from SQL lose all their vectors
+        for note_id in set(note_ids) - {note.id for note in notes}:
+            delete_note_vectors(note_id)
+
+        if not notes:
+            return
+
+        # 2️⃣ Split every note into token windows. Blank windows have nothing
+        # to embed (the API rejects empty input); a blank note gets no vectors.
+        chunks = {
+            note.id: [chunk for chunk in chunk_text(note_text(note.title, note.content)) if chunk.text.strip()]
+            for note in notes
+        }
+
+        # 3️⃣ One embeddings call for all chunks of the batch (cached texts skipped)
+        texts = [chunk.text for note in notes for chunk in chunks[note.id]]
+        embeddings = iter(embedder.embed_many(texts))
+
+        # 4️⃣ One multi-vector upsert (fixed ids, so replays overwrite).
+        # Only ids, filter fields and offsets; the text stays in SQL.
+        get_vector_store().upsert(
+            vectors=[
+                {
+                    "id": chunk_vector_id(note.id, chunk.index),
+                    "values": next(embeddings),
+                    "metadata": {
+                        "user_id": note.user_id,
+                        "note_id": note.id,
+                        "chunk": chunk.index,
+                        "start": chunk.start,
+                        "end": chunk.end,
+                        "created_at": note.create_at.astimezone(timezone.utc).isoformat()
+                    }
+                }
+                for note in notes
+                for chunk in chunks[note.id]
+            ]
+        )
+
+        # 5️⃣ An edit that shortened a note leaves trailing chunks
+        for note in notes:
+            if note.id in replace:
+                delete_note_vectors(note.id, keep={
+                    chunk_vector_id(note.id, chunk.index) for chunk in chunks[note.id]
+                })
+
+
+# --------------------------------------------------
+# ACCOUNT PURGE
+# --------------------------------------------------
+
+def purge_user(user_id: int, max_batches: int = USER_PURGE_BATCHES_PER_ROUND) -> bool:
+    # Deletes up to max_batches batches of the user's notes, vectors first
+    # so a failure never leaves vectors without their note. Returns True
+    # once nothing is left and the user row is gone.
+    with SessionLocal() as db:
+        user = db.get(models.User, user_id)
+    if user is not None and user.deleted_at is None:
+        logger.warning("Ignoring purge of user %d, account is not deleted", user_id)
+        return True
+
+    store = get_vector_store()
+    for _ in range(max_batches):
+        with SessionLocal() as db:
+            notes = db.execute(
+                select(models.Notes.id, models.Notes.title, models.Notes.content)
+                .where(models.Notes.user_id == user_id)
+                .limit(USER_PURGE_BATCH_SIZE)
+            ).all()
+
+        if not notes:
+            _finish_purge(user_id)
+            return True
+
+        # 1️⃣ Explicit ids, no metadata-filter delete (serverless indexes lack it)
+        store.delete_ids([id for note in notes for id in note_vector_ids(note.id, note.title, note.content)])
+
+        # 2️⃣ A short transaction per batch; no long row locks
+        with SessionLocal() as db:
+            purged = db.execute(delete(models.Notes).where(models.Notes.id.in_([note.id for note in notes]))).rowcount
+            db.execute(
+                update(models.UserDeletion)
+                .where(models.UserDeletion.user_id == user_id)
+                .values(notes_purged=models.UserDeletion.notes_purged + purged)
+            )
+            db.commit()
+        logger.info("Purged %d notes of user %d", purged, user_id)
+    return False
+
+
+def _finish_purge(user_id: int):
+    with SessionLocal() as db:
+        db.execute(delete(models.User).where(models.User.id == user_id, models.User.deleted_at.isnot(None)))
+        db.execute(
+            update(models.UserDeletion)
+            .where(models.UserDeletion.user_id == user_id, models.UserDeletion.finished_at.is_(None))
+            .values(finished_at=func.now())
+        )
+        db.commit()
+    logger.info("Finished deleting user %d", user_id)
+
+
+# --------------------------------------------------
+# RECONCILER
+# --------------------------------------------------
+
+def reconcile(batch_size: int = RECONCILE_BATCH_SIZE) -> dict:
+    # Diffs SQL note ids against vector ids and queues repairs through the
+    # outbox: orphan vectors get a delete, unindexed notes a create, and
+    # dead-lettered rows another round of retries. Notes with outbox rows
+    # still pending are left to the worker.
+    with engine.connect() as lock_conn:
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": RECONCILE_LOCK_KEY}).scalar():
+            return {"skipped": True}
+        try:
+            return _reconcile(batch_size)
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": RECONCILE_LOCK_KEY})
+
+
+def _reconcile(batch_size: int) -> dict:
+    # Works one page at a time in both directions, so memory stays at one
+    # page however many notes and vectors there are
+    store = get_vector_store()
+    orphans = 0
+    missing = 0
+
+    # 0️⃣ Failed rows get another INDEX_MAX_RETRIES attempts
+    with SessionLocal() as db:
+        rearmed = db.execute(
+            update(models.IndexOutbox)
+            .where(models.IndexOutbox.attempts >= INDEX_MAX_RETRIES)
+            .values(attempts=0, available_at=func.now())
+        ).rowcount
+        db.commit()
+
+    # 1️⃣ Vector ids whose note is gone from SQL. A note's chunks can span
+    # pages; committing per page makes its delete "pending" for the next.
+    for page in store.iter_id_pages("note-", batch_size):
+        page_ids = {note_id_from_vector_id(id) for id in page} - {None}
+        if not page_ids:
+            continue
+        with SessionLocal() as db:
+            known = set(db.scalars(select(models.Notes.id).where(models.Notes.id.in_(page_ids))))
+            known |= set(db.scalars(
+                select(models.IndexOutbox.note_id).where(models.IndexOutbox.note_id.in_(page_ids - known))
+            ))
+            gone = page_ids - known
+            if gone:
+                db.add_all(models.IndexOutbox(op=DELETE, note_id=note_id) for note_id in gone)
+                db.commit()
+        orphans += len(gone)
+
+    # 2️⃣ SQL notes (keyset pages) without vectors; notes with outbox rows
+    # still pending are left to the worker
+    last_id = 0
+    while True:
+        with SessionLocal() as db:
+            # Blank notes have no vectors to find
+            page = db.execute(
+                select(models.Notes.id, models.Notes.user_id)
+                .where(models.Notes.id > last_id, func.concat(models.Notes.title, models.Notes.content).op("~")(r"\S"))
+                .order_by(models.Notes.id)
+                .limit(batch_size)
+            ).all()
+            if not page:
+                break
+            last_id = page[-1].id
+            pending = set(db.scalars(
+                select(models.IndexOutbox.note_id).where(models.IndexOutbox.note_id.in_([note.id for note in page]))
+            ))
+
+        # Every indexed note has a first chunk (or the pre-chunking vector)
+        candidates = [note for note in page if note.id not in pending]
+        stored = store.existing_ids([
+            id for note in candidates for id in (chunk_vector_id(note.id, 0), f"note-{note.id}")
+        ])
+        gaps = [
+            note for note in candidates
+            if chunk_vector_id(note.id, 0) not in stored and f"note-{note.id}" not in stored
+        ]
+        if gaps:
+            with SessionLocal() as db:
+                db.add_all(models.IndexOutbox(op=CREATE, note_id=note.id, user_id=note.user_id) for note in gaps)
+                db.commit()
+        missing += len(gaps)
+
+    if orphans or missing or rearmed:
+        logger.info("Reconcile queued %d orphan deletes, %d missing notes, %d retries", orphans, missing, rearmed)
+        note_indexer.wake()
+    return {"orphans": orphans, "missing": missing, "retried": rearmed}
+
+
+# --------------------------------------------------
+# LOCAL VECTOR STORE
+# --------------------------------------------------
+# VECTOR_BACKEND=local keeps vectors in this process' memory only. Each
+# worker's indexer would fill a private store with whatever rows it
+# claimed, so a second process is refused; and every start begins empty,
+# so the store is rebuilt from SQL.
+
+_local_store_conn = None
+
+
+def open_local_store():
+    global _local_store_conn
+    conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    if not conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": LOCAL_STORE_LOCK_KEY}).scalar():
+        conn.close()
+        raise RuntimeError(
+            "VECTOR_BACKEND=local keeps vectors in a single process and another one is "
+            "already serving this database; run one worker or use Pinecone"
+        )
+    _local_store_conn = conn
+
+    # Every note is missing from an empty store: queue them all
+    result = reconcile()
+    logger.info("Rebuilding local vector store: %s", result)
+
+
+def close_local_store():
+    global _local_store_conn
+    if _local_store_conn is not None:
+        _local_store_conn.close()  # ends the session, releasing the lock
+        _local_store_conn = None
+
+
+def reindex_all(batch_size: int = RECONCILE_BATCH_SIZE) -> int:
+    # Queues an update for every note, e.g. to rewrite vectors after a
+    # metadata change; one INSERT ... SELECT per keyset page
+    queued = 0
+    last_id = 0
+    with SessionLocal() as db:
+        while True:
+            page = (
+                select(literal(UPDATE), models.Notes.id, models.Notes.user_id)
+                .where(models.Notes.id > last_id)
+                .order_by(models.Notes.id)
+                .limit(batch_size)
+            )
+            rows = db.execute(
+                insert(models.IndexOutbox)
+                .from_select(["op", "note_id", "user_id"], page)
+                .returning(models.IndexOutbox.note_id)
+            ).scalars().all()
+            db.commit()
+            if not rows:
+                break
+            queued += len(rows)
+            last_id = max(rows)
+
+    if queued:
+        note_indexer.wake()
+    return queued
+
+
+note_indexer = NoteIndexer()
@@ -1,35 +1,62 @@
 from fastapi import Body, FastAPI, responses, status, HTTPException, Depends
-from sqlalchemy.orm import Session
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import time
-from app.models import models
-from app.database.database import engine
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import os
+from app.database.database import engine, async_engine, wait_for_database
+from app.clients.clients import init_clients, close_clients
 from app.routers import notes,ai_route,user,auth,admin
+from app.indexing.indexing import close_local_store, note_indexer, open_local_store
+from app.vectorstore.vectorstore import VECTOR_BACKEND
+from app.metrics.metrics import MetricsMiddleware, metrics_endpoint
+from app.chunking.chunking import EMBEDDING_ENCODING, load_encodings
+from app.context.context import CHAT_ENCODING
+from app.utils.serialization import default_response_class
 
-# Create tables
-models.Base.metadata.create_all(bind=engine)
-
-app = FastAPI()
-
-
-# PostgreSQL (psycopg2) connection loop
-while True:
-    try:
-        conn = psycopg2.connect(
-            host="localhost",
-            database="fastAPI",
-            user="postgres",
-            password="password",
-            cursor_factory=RealDictCursor
-        )
-        cursor = conn.cursor()
-        print("Database connected successfully")
-        break
-    except Exception as error:
-        print("Database connection failed")
-        print("Error:", error)
-        time.sleep(2)
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+
+# Schema creation and Pinecone index provisioning are explicit steps now:
+#   python -m app.cli init-db
+#   python -m app.cli create-index
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 1️⃣ Bounded retry/backoff instead of blocking forever on the DB
+    await wait_for_database()
+
+    # 2️⃣ One OpenAI / vector store client per worker
+    init_clients()
+
+    # tiktoken fetches its BPE files on first use; never on the event loop
+    await asyncio.to_thread(load_encodings, EMBEDDING_ENCODING, CHAT_ENCODING)
+
+    # 3️⃣ The in-memory vector store starts empty: claim it for this
+    # process and queue every note for indexing
+    if VECTOR_BACKEND == "local":
+        await asyncio.to_thread(open_local_store)
+
+    # 4️⃣ Background embedding/indexing worker
+    note_indexer.start()
+
+    yield
+
+    note_indexer.stop()
+    close_local_store()
+    await close_clients()
+    await async_engine.dispose()
+    engine.dispose()
+
+
+# FAST_SERIALIZATION=true renders every JSON response with orjson
+app = FastAPI(lifespan=lifespan, default_response_class=default_response_class())
+
+# Per-route/per-stage histograms, Server-Timing headers, sampled profiling
+app.add_middleware(MetricsMiddleware)
+app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
 
 
 app.include_router(user.router)
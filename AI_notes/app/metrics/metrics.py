@@ -0,0 +1,211 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from dotenv import load_dotenv
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from prometheus_client import REGISTRY
+from starlette.requests import Request
+from starlette.responses import Response
+
+load_dotenv()
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+
+# Fraction of requests run under cProfile; changeable at runtime via
+# PUT /admin/profiling
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+PROFILE_TOP_FUNCTIONS = 25
+
+# Upstream stages timed individually
+EMBED = "embed"
+VECTOR_QUERY = "vector_query"
+VECTOR_UPSERT = "vector_upsert"
+VECTOR_DELETE = "vector_delete"
+VECTOR_LIST = "vector_list"
+LLM = "llm"
+LLM_FIRST_TOKEN = "llm_first_token"
+SQL = "sql"
+BCRYPT = "bcrypt"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+# --------------------------------------------------
+# PROMETHEUS METRICS
+# --------------------------------------------------
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Request latency by route",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+
+STAGE_LATENCY = Histogram(
+    "upstream_stage_duration_seconds",
+    "Latency of upstream calls by stage",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+
+STAGE_ERRORS = Counter(
+    "upstream_stage_errors_total",
+    "Failed upstream calls by stage",
+    ["stage"]
+)
+
+
+def metrics_endpoint(request: Request) -> Response:
+    # With several workers, PROMETHEUS_MULTIPROC_DIR makes every worker
+    # write its samples to disk and this endpoint aggregates them
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+# --------------------------------------------------
+# PER-REQUEST TIMINGS (Server-Timing)
+# --------------------------------------------------
+
+# stage -> [total seconds, calls] for the current request, if any
+_timings: ContextVar[Optional[dict]] = ContextVar("timings", default=None)
+
+
+def record_stage(stage: str, seconds: float):
+    STAGE_LATENCY.labels(stage).observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        entry = timings.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+@contextmanager
+def timed(stage: str):
+    # Usable around sync and awaited calls alike
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def server_timing(timings: dict, total: float) -> str:
+    parts = [
+        f'{stage};dur={seconds * 1000:.1f};desc="{calls} call{"s" if calls != 1 else ""}"'
+        for stage, (seconds, calls) in timings.items()
+    ]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+# --------------------------------------------------
+# SAMPLED PROFILING
+# --------------------------------------------------
+
+class Profiler:
+    # cProfile sees everything on the event loop while it runs, so
+    # concurrent requests show up in a sample too; only one request is
+    # profiled at a time.
+    def __init__(self, sample_rate: float = PROFILE_SAMPLE_RATE, keep: int = PROFILE_KEEP):
+        self.sample_rate = sample_rate
+        self._profiles: deque = deque(maxlen=keep)
+        self._busy = threading.Lock()
+
+    def start(self) -> Optional[cProfile.Profile]:
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) is already active
+            self._busy.release()
+            return None
+        return profile
+
+    def finish(self, profile: cProfile.Profile, method: str, path: str, seconds: float):
+        profile.disable()
+        self._busy.release()
+
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        self._profiles.append({
+            "method": method,
+            "path": path,
+            "ms": round(seconds * 1000, 1),
+            "at": time.time(),
+            "stats": out.getvalue()
+        })
+
+    def profiles(self) -> list[dict]:
+        return list(self._profiles)
+
+
+profiler = Profiler()
+
+
+# --------------------------------------------------
+# MIDDLEWARE
+# --------------------------------------------------
+
+class MetricsMiddleware:
+    # Plain ASGI middleware: it works with streaming responses and does not
+    # buffer bodies. Server-Timing goes out with the response headers, so
+    # for SSE it covers the work done before the first byte.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: dict = {}
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        status_code = 500
+        profile = profiler.start()
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(timings, time.perf_counter() - started).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - started
+            _timings.reset(token)
+
+            # Label by route template so /notes/1 and /notes/2 share a series
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.labels(scope["method"], path, str(status_code)).observe(elapsed)
+
+            if profile is not None:
+                profiler.finish(profile, scope["method"], scope["path"], elapsed)
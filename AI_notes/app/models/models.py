@@ -1,10 +1,19 @@
-from sqlalchemy import Column, Integer, String, TIMESTAMP, text, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, TIMESTAMP, text, ForeignKey, Computed, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from app.database.database import Base
 
+# Text search configuration baked into notes.search_vector
+NOTES_SEARCH_CONFIG = "english"
+NOTES_SEARCH_EXPRESSION = f"to_tsvector('{NOTES_SEARCH_CONFIG}', title || ' ' || content)"
+
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # GET /users/ pages live accounts by (create_at, id)
+        Index("ix_users_live_create_at_id", "create_at", "id", postgresql_where=text("deleted_at IS NULL")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, nullable=False, unique=True)
@@ -12,12 +21,27 @@ class User(Base):
     create_at = Column( TIMESTAMP(timezone=True),nullable=False,server_default=text("NOW()"))
     role = Column(String, nullable=False, default="User")
 
+    # Bumped in the same transaction as every change to the user's notes;
+    # GET /notes ETags are built from it
+    notes_version = Column(BigInteger, nullable=False, server_default=text("0"))
+
+    # Set by DELETE /users/{id}; the row goes once the purge job is done
+    deleted_at = Column(TIMESTAMP(timezone=True), nullable=True)
+
     # ✅ relationship with cascade delete
     notes = relationship( "Notes",back_populates="user",cascade="all, delete",passive_deletes=True)
 
 
 class Notes(Base):
     __tablename__ = "notes"
+    __table_args__ = (
+        Index("ix_notes_search_vector", "search_vector", postgresql_using="gin"),
+        # GET /notes/ for a user (keyset on create_at, id); the user_id prefix
+        # also serves the ON DELETE CASCADE, account purges and counts
+        Index("ix_notes_user_id_create_at_id", "user_id", "create_at", "id"),
+        # GET /notes/ for admins (all notes, same order)
+        Index("ix_notes_create_at_id", "create_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
@@ -26,5 +50,34 @@ class Notes(Base):
 
     user_id = Column(Integer,ForeignKey("users.id", ondelete="CASCADE"),nullable=False)
 
+    # ✅ full-text index, kept in sync by Postgres on every insert/update
+    search_vector = deferred(Column(TSVECTOR, Computed(NOTES_SEARCH_EXPRESSION, persisted=True)))
+
     # ✅ relationship back to user
     user = relationship("User",back_populates="notes")
+
+
+class IndexOutbox(Base):
+    # Pending vector-store work, written in the same transaction as the
+    # note change and drained by the background indexer
+    __tablename__ = "index_outbox"
+
+    id = Column(BigInteger, primary_key=True)
+    op = Column(String, nullable=False)   # create | update | delete | delete_user
+    note_id = Column(Integer, nullable=True, index=True)
+    user_id = Column(Integer, nullable=True)
+    create_at = Column(TIMESTAMP(timezone=True),nullable=False,server_default=text("NOW()"))
+    available_at = Column(TIMESTAMP(timezone=True),nullable=False,server_default=text("NOW()"))
+    attempts = Column(Integer, nullable=False, server_default=text("0"))
+    last_error = Column(String, nullable=True)
+
+
+class UserDeletion(Base):
+    # Progress of a background account purge; kept after the user row is
+    # gone (no foreign key) so the outcome stays visible
+    __tablename__ = "user_deletions"
+
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    requested_at = Column(TIMESTAMP(timezone=True),nullable=False,server_default=text("NOW()"))
+    notes_purged = Column(Integer, nullable=False, server_default=text("0"))
+    finished_at = Column(TIMESTAMP(timezone=True), nullable=True)
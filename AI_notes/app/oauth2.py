@@ -2,7 +2,8 @@ from jose import jwt, JWTError
 from datetime import datetime, timedelta
 from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from app.database.database import get_db
+from app.database.database import AsyncSessionLocal
+from app.cache.cache import Principal, principal_cache
 from app.models import models
 from app.schemas import schemas
 import os
@@ -19,6 +20,10 @@ SECRET_KEY = os.getenv("SECRET_KEY_JWT")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 300000
 
+# Trust the user_id/role claims without checking the users table. Role
+# changes and deletions then only take effect when the token expires.
+AUTH_STATELESS = os.getenv("AUTH_STATELESS", "false").lower() in ("1", "true", "yes")
+
 
 # ======================
 # CREATE JWT TOKEN
@@ -56,9 +61,8 @@ def verify_access_token(token: str, credentials_exception):
 # ======================
 # GET CURRENT USER
 # ======================
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db=Depends(get_db)
+async def get_current_user(
+    token: str = Depends(oauth2_scheme)
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -68,14 +72,21 @@ def get_current_user(
 
     token_data = verify_access_token(token, credentials_exception)
 
-    user = db.query(models.User).filter(
-        models.User.id == token_data.id
-    ).first()
+    if AUTH_STATELESS:
+        return Principal(id=token_data.id, role=token_data.role)
+
+    # Recently seen users skip the SELECT on users entirely
+    principal = principal_cache.get(token_data.id)
+    if principal:
+        return principal
+
+    async with AsyncSessionLocal() as db:
+        user = await db.get(models.User, token_data.id)
 
-    if not user:
+    if not user or user.deleted_at is not None:
         raise credentials_exception
 
-    return user
+    return principal_cache.put(Principal(id=user.id, role=user.role, email=user.email))
 
 
 # ======================
@@ -0,0 +1,285 @@
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import Depends, HTTPException, status
+
+from ..oauth2 import get_current_user
+
+load_dotenv()
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+
+# "memory" keeps buckets per worker; "redis" shares them between workers
+# and hosts (pip install redis, REDIS_URL)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_PREFIX = os.getenv("RATE_LIMIT_PREFIX", "ratelimit")
+
+# Budgets, per user: sustained rate per minute and burst size
+EMBED_PER_MINUTE = float(os.getenv("RATE_LIMIT_EMBED_PER_MINUTE", "60"))
+EMBED_BURST = float(os.getenv("RATE_LIMIT_EMBED_BURST", "20"))
+CHAT_PER_MINUTE = float(os.getenv("RATE_LIMIT_CHAT_PER_MINUTE", "20"))
+CHAT_BURST = float(os.getenv("RATE_LIMIT_CHAT_BURST", "5"))
+
+# Notes per minute a user may queue through POST /notes/bulk; charged per
+# inserted chunk, so keep the burst at least BULK_INSERT_CHUNK
+BULK_PER_MINUTE = float(os.getenv("RATE_LIMIT_BULK_PER_MINUTE", "3000"))
+BULK_BURST = float(os.getenv("RATE_LIMIT_BULK_BURST", "5000"))
+
+# Completions one user may have running at once (streams included)
+LLM_MAX_CONCURRENT = int(os.getenv("RATE_LIMIT_LLM_CONCURRENT", "2"))
+
+# In-memory backend: idle buckets beyond this are evicted oldest first
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# Redis backend: a worker that dies mid-request leaks its slot for this long
+LLM_SLOT_TTL = int(os.getenv("RATE_LIMIT_LLM_SLOT_TTL", "300"))
+
+EMBED = "embed"
+CHAT = "chat"
+BULK = "bulk"
+
+
+@dataclass(frozen=True)
+class Budget:
+    rate: float  # tokens per second
+    burst: float
+
+    @classmethod
+    def per_minute(cls, per_minute: float, burst: float) -> "Budget":
+        return cls(per_minute / 60, max(burst, 1))
+
+
+BUDGETS = {
+    EMBED: Budget.per_minute(EMBED_PER_MINUTE, EMBED_BURST),
+    CHAT: Budget.per_minute(CHAT_PER_MINUTE, CHAT_BURST),
+    BULK: Budget.per_minute(BULK_PER_MINUTE, BULK_BURST),
+}
+
+
+def retry_after_header(seconds: float) -> dict:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+# --------------------------------------------------
+# BACKENDS
+# --------------------------------------------------
+
+class RateLimitBackend(ABC):
+    # take() returns 0 when the tokens were taken, otherwise the seconds
+    # until they will be available
+
+    @abstractmethod
+    async def take(self, key: str, budget: Budget, cost: float = 1) -> float:
+        ...
+
+    @abstractmethod
+    async def acquire_slot(self, key: str, limit: int) -> bool:
+        ...
+
+    @abstractmethod
+    async def release_slot(self, key: str):
+        ...
+
+
+class MemoryBackend(RateLimitBackend):
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # key -> (tokens, updated_at), least recently used first
+        self._buckets: OrderedDict = OrderedDict()
+        self._slots: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, budget: Budget, cost: float = 1) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (budget.burst, now))
+            tokens = min(budget.burst, tokens + (now - updated_at) * budget.rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / budget.rate if budget.rate else math.inf
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    async def acquire_slot(self, key: str, limit: int) -> bool:
+        with self._lock:
+            in_flight = self._slots.get(key, 0)
+            if in_flight >= limit:
+                return False
+            self._slots[key] = in_flight + 1
+            return True
+
+    async def release_slot(self, key: str):
+        with self._lock:
+            in_flight = self._slots.get(key, 0) - 1
+            if in_flight > 0:
+                self._slots[key] = in_flight
+            else:
+                self._slots.pop(key, None)
+
+
+# Refill and take in one round trip; Redis' own clock so hosts don't
+# need synchronised time
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+_ACQUIRE_SCRIPT = """
+local n = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+if n > tonumber(ARGV[1]) then
+    redis.call('DECR', KEYS[1])
+    return 0
+end
+return 1
+"""
+
+# The slot key may have expired meanwhile; never go below zero
+_RELEASE_SCRIPT = """
+if redis.call('DECR', KEYS[1]) <= 0 then
+    redis.call('DEL', KEYS[1])
+end
+return 1
+"""
+
+
+class RedisBackend(RateLimitBackend):
+    def __init__(self, url: str = REDIS_URL, prefix: str = RATE_LIMIT_PREFIX):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis needs the redis package (pip install redis)") from e
+
+        self.prefix = prefix
+        self._redis = redis.from_url(url)
+        self._take = self._redis.register_script(_TAKE_SCRIPT)
+        self._acquire = self._redis.register_script(_ACQUIRE_SCRIPT)
+        self._release = self._redis.register_script(_RELEASE_SCRIPT)
+
+    async def take(self, key: str, budget: Budget, cost: float = 1) -> float:
+        wait = await self._take(keys=[f"{self.prefix}:bucket:{key}"], args=[budget.rate, budget.burst, cost])
+        return float(wait)
+
+    async def acquire_slot(self, key: str, limit: int) -> bool:
+        return bool(await self._acquire(keys=[f"{self.prefix}:slots:{key}"], args=[limit, LLM_SLOT_TTL]))
+
+    async def release_slot(self, key: str):
+        await self._release(keys=[f"{self.prefix}:slots:{key}"])
+
+
+def create_backend() -> RateLimitBackend:
+    if RATE_LIMIT_BACKEND == "memory":
+        return MemoryBackend()
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisBackend()
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND {RATE_LIMIT_BACKEND!r}")
+
+
+# --------------------------------------------------
+# LIMITER
+# --------------------------------------------------
+
+class RateLimiter:
+    def __init__(
+        self,
+        backend: Optional[RateLimitBackend] = None,
+        budgets: dict = BUDGETS,
+        llm_concurrency: int = LLM_MAX_CONCURRENT,
+        enabled: bool = RATE_LIMIT_ENABLED
+    ):
+        self._backend = backend
+        self.budgets = budgets
+        self.llm_concurrency = llm_concurrency
+        self.enabled = enabled
+
+    @property
+    def backend(self) -> RateLimitBackend:
+        # Created on first use so importing the app never connects to Redis
+        if self._backend is None:
+            self._backend = create_backend()
+        return self._backend
+
+    async def check(self, user_id: int, kind: str, cost: float = 1):
+        # Raises 429 with Retry-After when the user's budget is spent
+        if not self.enabled:
+            return
+        budget = self.budgets[kind]
+        # More than a full bucket could never be granted; charge a full one
+        wait = await self.backend.take(f"{kind}:{user_id}", budget, min(cost, budget.burst))
+        if wait > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Too many {kind} requests, retry later",
+                headers=retry_after_header(wait)
+            )
+
+    async def acquire_llm(self, user_id: int) -> "LLMSlot":
+        # Raises 429 when the user already has the maximum number of
+        # completions running; release the returned slot when done
+        if self.enabled and not await self.backend.acquire_slot(f"llm:{user_id}", self.llm_concurrency):
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"At most {self.llm_concurrency} answers in progress per user",
+                headers=retry_after_header(1)
+            )
+        return LLMSlot(self, f"llm:{user_id}" if self.enabled else None)
+
+
+class LLMSlot:
+    # release() is idempotent, so a stream can release from its own
+    # cleanup and from the response's background task
+    def __init__(self, limiter: RateLimiter, key: Optional[str]):
+        self._limiter = limiter
+        self._key = key
+
+    async def release(self):
+        key, self._key = self._key, None
+        if key is not None:
+            await self._limiter.backend.release_slot(key)
+
+
+rate_limiter = RateLimiter()
+
+
+# --------------------------------------------------
+# DEPENDENCIES
+# --------------------------------------------------
+
+def limit(kind: str, cost: float = 1):
+    # Route dependency: Depends(limit(EMBED)) charges the current user
+    async def dependency(current_user=Depends(get_current_user)):
+        await rate_limiter.check(current_user.id, kind, cost)
+        return current_user
+
+    return dependency
@@ -1,10 +1,15 @@
 from ..models import models
 from ..schemas.schemas import UserCreate,UserResponse
 from fastapi import Body, FastAPI, responses, status, HTTPException, Depends,APIRouter
-from ..database.database import engine, get_db
-from sqlalchemy.orm import Session
-from ..oauth2 import get_current_user
-from app.utils.utils import hash_password
+from ..database.database import get_async_db, pool_stats
+from ..metrics.metrics import profiler
+from ..schemas.schemas import ProfilingSettings
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..oauth2 import get_current_user, get_admin_user
+from ..embeddings.embeddings import embedder
+from ..cache.cache import answer_cache, note_text_cache, principal_cache, response_cache
+from ..singleflight.singleflight import ask_flights
+from app.utils.utils import hash_password_async
 
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
@@ -12,7 +17,7 @@ router = APIRouter(prefix="/admin", tags=["Admin"])
 
 
 @router.post("/", response_model=UserResponse)
-async def create_user_by_admin(user: UserCreate,db: Session = Depends(get_db),current_user = Depends(get_current_user)):
+async def create_user_by_admin(user: UserCreate,db: AsyncSession = Depends(get_async_db),current_user = Depends(get_current_user)):
     
 
     if current_user.role != "Admin":
@@ -21,13 +26,72 @@ async def create_user_by_admin(user: UserCreate,db: Session = Depends(get_db),cu
             detail="Admins only"
         )
 
-    hashed_password = hash_password(user.password)
+    hashed_password = await hash_password_async(user.password)
 
     new_user = models.User(email=user.email,password=hashed_password,role="Admin")
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     return new_user
 
+
+
+@router.get("/stats/embedding-cache")
+async def embedding_cache_stats(current_user = Depends(get_admin_user)):
+    return embedder.stats()
+
+
+@router.get("/stats/answer-cache")
+async def answer_cache_stats(current_user = Depends(get_admin_user)):
+    return answer_cache.stats()
+
+
+@router.get("/stats/principal-cache")
+async def principal_cache_stats(current_user = Depends(get_admin_user)):
+    return principal_cache.stats()
+
+
+@router.get("/stats/note-cache")
+async def note_cache_stats(current_user = Depends(get_admin_user)):
+    return note_text_cache.stats()
+
+
+@router.get("/stats/response-cache")
+async def response_cache_stats(current_user = Depends(get_admin_user)):
+    return response_cache.stats()
+
+
+@router.get("/stats/single-flight")
+async def single_flight_stats(current_user = Depends(get_admin_user)):
+    return {
+        "ask": ask_flights.stats(),
+        "embeddings_coalesced": embedder.coalesced,
+    }
+
+
+
+@router.get("/stats/db-pool")
+async def db_pool_stats(current_user = Depends(get_admin_user)):
+    return pool_stats()
+
+
+
+# Sampled request profiling, switchable at runtime (per worker process)
+@router.get("/profiling", response_model=ProfilingSettings)
+async def get_profiling(current_user = Depends(get_admin_user)):
+    return {"sample_rate": profiler.sample_rate}
+
+
+
+@router.put("/profiling", response_model=ProfilingSettings)
+async def set_profiling(settings: ProfilingSettings, current_user = Depends(get_admin_user)):
+    profiler.sample_rate = settings.sample_rate
+    return {"sample_rate": profiler.sample_rate}
+
+
+
+@router.get("/profiles")
+async def get_profiles(current_user = Depends(get_admin_user)):
+    return profiler.profiles()
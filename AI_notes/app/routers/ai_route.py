@@ -1,114 +1,381 @@
-from fastapi import APIRouter, HTTPException, Depends
-from openai import OpenAI
-from pinecone import Pinecone
-from dotenv import load_dotenv
-import os
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from dataclasses import replace
+from sqlalchemy import Integer, any_, bindparam, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import json
+import logging
+import time
 
 from ..schemas.schemas import QuestionRequest
 from ..oauth2 import get_current_user
+from ..clients.clients import get_async_openai, get_vector_store
+from ..embeddings.embeddings import embedder
+from ..cache.cache import answer_cache, note_text_cache, question_key
+from ..chunking.chunking import count_tokens
+from ..context.context import CHAT_ENCODING, CHAT_MODEL, CONTEXT_TOP_K, build_context, match_note_id, match_span
+from ..indexing.indexing import note_text
+from ..models import models
+from ..database.database import get_async_db
+from ..search.search import any_terms, fulltext_search, reciprocal_rank_fusion
+from ..vectorstore.vectorstore import Match
+from ..metrics.metrics import LLM, LLM_FIRST_TOKEN, STAGE_ERRORS, record_stage, timed
+from ..ratelimit.ratelimit import CHAT, EMBED, LLMSlot, rate_limiter
+from ..singleflight.singleflight import SingleFlight, ask_flights
+from .notes import notes_version
+
+logger = logging.getLogger(__name__)
 
 # --------------------------------------------------
-# ENV SETUP
+# ROUTER
 # --------------------------------------------------
 
-load_dotenv()
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-
-if not OPENAI_API_KEY:
-    raise ValueError("Missing OPENAI_API_KEY")
-
-if not PINECONE_API_KEY:
-    raise ValueError("Missing PINECONE_API_KEY")
+router = APIRouter(prefix="/AI", tags=["AI"])
 
 # --------------------------------------------------
-# CLIENTS
+# HELPERS
 # --------------------------------------------------
 
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-pc = Pinecone(api_key=PINECONE_API_KEY)
+async def embed_text(text: str) -> list[float]:
+    return await embedder.aembed(text)
 
-INDEX_NAME = "notes-api"
-index = pc.Index(INDEX_NAME)
 
-# --------------------------------------------------
-# ROUTER
-# --------------------------------------------------
+def build_messages(context: str, question: str) -> list[dict]:
+    return [
+        {
+            "role": "system",
+            "content": (
+                "Answer ONLY using the provided notes. "
+                "If the answer is not present, say you don't know."
+            )
+        },
+        {
+            "role": "user",
+            "content": f"NOTES:\n{context}\n\nQUESTION: {question}"
+        }
+    ]
 
-router = APIRouter(prefix="/AI", tags=["AI"])
 
-# --------------------------------------------------
-# HELPERS
-# --------------------------------------------------
+def prompt_tokens(messages: list[dict]) -> int:
+    # Estimate; the API's usage block reports the exact figure
+    return sum(count_tokens(m["content"], CHAT_ENCODING) + 4 for m in messages) + 3
 
-def embed_text(text: str) -> list[float]:
-    response = openai_client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
-    )
-    return response.data[0].embedding
 
-# --------------------------------------------------
-# ASK AI
-# --------------------------------------------------
+def usage_info(usage) -> dict:
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens
+    }
 
-@router.post("/ask")
-async def ask_ai(
-    payload: QuestionRequest,
-    current_user=Depends(get_current_user)
-):
-    # 1️⃣ Embed the question
-    question_embedding = embed_text(payload.question)
 
-    # 2️⃣ Query Pinecone (user-scoped)
-    query_response = index.query(
+async def vector_matches(user_id: int, question_embedding: list[float]) -> list[Match]:
+    # Query the vector store (user-scoped) for the best chunks
+    query_response = await get_vector_store().aquery(
         vector=question_embedding,
-        top_k=5,
+        top_k=CONTEXT_TOP_K,
         include_metadata=True,
         filter={
-            "user_id": current_user.id
+            "user_id": user_id
         }
     )
+    return query_response.matches
+
+
+async def hydrate_matches(db: AsyncSession, user_id: int, matches: list[Match]) -> list[Match]:
+    # Vectors only carry offsets; chunk text is cut from the note in SQL.
+    # One query for every note not in the hot-note cache; notes deleted
+    # since they were indexed drop out.
+    note_ids = {match_note_id(m) for m in matches}
+    texts = note_text_cache.get_many(user_id, note_ids)
+
+    missing = list(note_ids - texts.keys())
+    if missing:
+        rows = await db.execute(
+            select(models.Notes.id, models.Notes.title, models.Notes.content)
+            .where(
+                models.Notes.id == any_(bindparam("note_ids", missing, type_=ARRAY(Integer))),
+                models.Notes.user_id == user_id
+            )
+        )
+        for row in rows:
+            texts[row.id] = note_text_cache.put(user_id, row.id, note_text(row.title, row.content))
+
+    hydrated = []
+    for match in matches:
+        text = texts.get(match_note_id(match))
+        if text is None:
+            continue
+        start, end = match_span(match)
+        if start is not None:
+            text = text[start:end]
+        hydrated.append(replace(match, metadata={**match.metadata, "text": text}))
+    return hydrated
+
+
+async def keyword_matches(db: AsyncSession, user_id: int, question: str) -> list[Match]:
+    # Full-text hits shaped like vector matches (whole note as the text)
+    rows = await fulltext_search(db, any_terms(question), CONTEXT_TOP_K, user_id=user_id)
+    return [
+        Match(
+            id=f"note-{row.id}",
+            score=row.rank,
+            metadata={"note_id": row.id, "user_id": row.user_id, "text": note_text(row.title, row.content)}
+        )
+        for row in rows
+    ]
+
+
+def fuse_matches(vector: list[Match], keyword: list[Match]) -> list[Match]:
+    # Reciprocal-rank fusion at note level. A note found by both retrievers
+    # is represented by its vector chunks, which are finer grained.
+    fused = reciprocal_rank_fusion(
+        list(dict.fromkeys(match_note_id(m) for m in vector)),
+        [match_note_id(m) for m in keyword]
+    )
+
+    chunks: dict[int, list[Match]] = {}
+    for match in vector:
+        chunks.setdefault(match_note_id(match), []).append(match)
+    for match in keyword:
+        chunks.setdefault(match_note_id(match), [match])
+
+    # Every match takes its note's fused score; sorting stays stable so
+    # chunks of one note keep their vector order
+    return [replace(match, score=score) for id, score in fused.items() for match in chunks[id]]
+
 
-    if not query_response.matches:
+def retrieve_context(vector: list[Match], keyword: list[Match], mode: str):
+    matches = fuse_matches(vector, keyword) if mode == "hybrid" else vector or keyword
+
+    if not matches:
         raise HTTPException(
             status_code=404,
             detail="No relevant notes found"
         )
 
-    # 3️⃣ Build context from metadata.text
-    context = "\n\n".join(
-        match.metadata["text"]
-        for match in query_response.matches
-        if "text" in match.metadata
-    )
+    # Rank, dedupe overlapping windows and fill the token budget
+    context = build_context(matches)
 
-    if not context.strip():
+    if not context.text.strip():
         raise HTTPException(
             status_code=500,
-            detail="Vector data exists but text metadata is missing"
+            detail="Matched notes have no text"
+        )
+
+    return context
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def wants_event_stream(request: Request) -> bool:
+    return "text/event-stream" in request.headers.get("accept", "")
+
+# --------------------------------------------------
+# ASK AI
+# --------------------------------------------------
+
+@router.post("/ask", responses={200: {"content": {"text/event-stream": {}}}})
+async def ask_ai(
+    payload: QuestionRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user)
+):
+    stream = wants_event_stream(request)
+
+    # Read before retrieval: a note write racing this ask leaves its answer
+    # behind the version, so it is never served
+    version = await notes_version(db, current_user.id)
+
+    # 0️⃣ Same question asked recently -> no upstream calls at all
+    cached = answer_cache.get_exact(current_user.id, payload.mode, payload.question, version)
+
+    # The same question is being answered right now (client retry, second
+    # tab) -> share that answer instead of running the pipeline twice
+    flight_key = (current_user.id, payload.mode, question_key(payload.question))
+    if not cached and (flight := ask_flights.in_flight(flight_key)) is not None:
+        cached = await ask_flights.wait(flight)
+
+    if cached:
+        return cached_response(payload.question, cached, stream)
+
+    flight = ask_flights.begin(flight_key)
+    try:
+        return await answer_question(payload, stream, db, current_user.id, version, flight)
+    except BaseException as e:
+        SingleFlight.fail(flight, e)
+        raise
+
+
+def cached_response(question: str, cached, stream: bool):
+    if stream:
+        return StreamingResponse(
+            stream_cached_answer(cached),
+            media_type="text/event-stream"
+        )
+    return {"question": question, "answer": cached.answer, "cached": True}
+
+
+async def answer_question(payload: QuestionRequest, stream: bool, db: AsyncSession, user_id: int, version: int, flight):
+    # Leads the flight: resolves it with the cached answer entry
+    mode = payload.mode
+
+    # 1️⃣ Embed the question; in hybrid mode full-text search runs meanwhile,
+    # keyword mode never calls the embeddings API
+    question_embedding = None
+    keyword = []
+    if mode != "keyword":
+        await rate_limiter.check(user_id, EMBED)
+
+    if mode == "keyword":
+        keyword = await keyword_matches(db, user_id, payload.question)
+    elif mode == "hybrid":
+        # The search uses the request's session: if the embedding fails it
+        # is cancelled and awaited, not left running while the session closes
+        search = asyncio.create_task(keyword_matches(db, user_id, payload.question))
+        try:
+            question_embedding = await embed_text(payload.question)
+        except BaseException:
+            search.cancel()
+            await asyncio.wait([search])
+            raise
+        keyword = await search
+    else:
+        question_embedding = await embed_text(payload.question)
+
+    # Near-identical question asked recently
+    if question_embedding is not None:
+        cached = answer_cache.get_similar(user_id, mode, question_embedding, version)
+        if cached:
+            SingleFlight.finish(flight, cached)
+            return cached_response(payload.question, cached, stream)
+
+    # Only answers that need a completion count against the chat budget
+    await rate_limiter.check(user_id, CHAT)
+
+    # 2️⃣ + 3️⃣ Retrieve notes and build context
+    vector = []
+    if question_embedding is not None:
+        vector = await hydrate_matches(db, user_id, await vector_matches(user_id, question_embedding))
+    context = retrieve_context(vector, keyword, mode)
+    messages = build_messages(context.text, payload.question)
+
+    # Cap on completions in flight for this user
+    slot = await rate_limiter.acquire_llm(user_id)
+
+    if stream:
+        # The stream resolves the flight; the background task covers a
+        # stream that never ran
+        async def cleanup():
+            await slot.release()
+            SingleFlight.fail(flight, HTTPException(status_code=503, detail="Answer stream was interrupted"))
+
+        return StreamingResponse(
+            stream_answer(user_id, payload, version, question_embedding, messages, context, slot, flight),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            background=BackgroundTask(cleanup)
         )
 
     # 4️⃣ Ask GPT using retrieved notes
-    completion = openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "Answer ONLY using the provided notes. "
-                    "If the answer is not present, say you don't know."
-                )
-            },
-            {
-                "role": "user",
-                "content": f"NOTES:\n{context}\n\nQUESTION: {payload.question}"
-            }
-        ]
+    try:
+        with timed(LLM):
+            completion = await get_async_openai().chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages
+            )
+    finally:
+        await slot.release()
+
+    answer = completion.choices[0].message.content
+
+    # 5️⃣ Remember the answer and which notes it was built from
+    entry = answer_cache.put(
+        user_id,
+        mode,
+        payload.question,
+        answer,
+        note_ids=context.note_ids,
+        notes_version=version,
+        embedding=question_embedding
     )
+    SingleFlight.finish(flight, entry)
 
     return {
         "question": payload.question,
-        "answer": completion.choices[0].message.content
+        "answer": answer,
+        "cached": False,
+        "usage": usage_info(completion.usage) if completion.usage else None,
+        "context": context.summary()
     }
+
+
+# --------------------------------------------------
+# STREAMING (Accept: text/event-stream)
+# --------------------------------------------------
+
+async def stream_cached_answer(cached):
+    yield sse_event("sources", {"note_ids": sorted(cached.note_ids), "cached": True})
+    yield sse_event("token", {"text": cached.answer})
+    yield sse_event("done", {})
+
+
+async def stream_answer(user_id, payload: QuestionRequest, version, question_embedding, messages, context, slot: LLMSlot, flight):
+    # Sources go out before the first token so clients can render them early
+    yield sse_event("sources", {
+        "note_ids": context.note_ids,
+        "cached": False,
+        "context": context.summary(),
+        "estimated_prompt_tokens": prompt_tokens(messages)
+    })
+
+    parts = []
+    usage = None
+    started = time.perf_counter()
+    try:
+        completion = await get_async_openai().chat.completions.create(
+            model=CHAT_MODEL,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in completion:
+            # With include_usage the last chunk has no choices, only usage
+            if chunk.usage:
+                usage = usage_info(chunk.usage)
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if text:
+                if not parts:
+                    record_stage(LLM_FIRST_TOKEN, time.perf_counter() - started)
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+    except Exception:
+        STAGE_ERRORS.labels(LLM).inc()
+        logger.exception("Streaming completion failed")
+        SingleFlight.fail(flight, HTTPException(status_code=502, detail="Completion failed"))
+        yield sse_event("error", {"detail": "Completion failed"})
+        return
+    finally:
+        await slot.release()
+
+    record_stage(LLM, time.perf_counter() - started)
+
+    entry = answer_cache.put(
+        user_id,
+        payload.mode,
+        payload.question,
+        "".join(parts),
+        note_ids=context.note_ids,
+        notes_version=version,
+        embedding=question_embedding
+    )
+    SingleFlight.finish(flight, entry)
+    yield sse_event("done", {"usage": usage})
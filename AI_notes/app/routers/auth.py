@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, status, HTTPException
-from sqlalchemy.orm import Session
-from ..database.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database.database import get_async_db
 from ..schemas.schemas import UserLogin,token
 from ..models.models import User
 from ..utils import utils
@@ -12,9 +13,9 @@ router = APIRouter(tags=["Authentication"])
 @router.post("/login", response_model=token)
 async def login(
     user_credentials: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(User).filter(User.email == user_credentials.username).first()
+    user = await db.scalar(select(User).where(User.email == user_credentials.username, User.deleted_at.is_(None)))
 
     if not user:
         raise HTTPException(
@@ -22,12 +23,20 @@ async def login(
             detail="Invalid credentials"
         )
 
-    if not utils.verify(user_credentials.password, user.password):
+    # bcrypt runs in the hashing pool, not on the event loop
+    valid, new_hash = await utils.verify_and_update_async(user_credentials.password, user.password)
+
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Invalid credentials"
         )
 
+    # Stored hash used an old BCRYPT_ROUNDS -> upgrade it transparently
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
+
     access_token = oauth2.create_access_token(
         data={"user_id": user.id, "role": user.role}
     )
@@ -1,45 +1,116 @@
 from ..models import models
-from ..schemas.schemas import Notes,NotesResponse,NotesCreate
-from fastapi import Body, FastAPI, responses, status, HTTPException, Depends,APIRouter
-from ..database.database import engine, get_db,pinecone_index
-from sqlalchemy.orm import Session
+from ..schemas.schemas import Notes,NotesResponse,NotesCreate,IndexStatus,BulkImportResponse,NoteSearchResult
+from fastapi import Body, FastAPI, responses, status, HTTPException, Depends,APIRouter,Query,Response,Request
+from pydantic import TypeAdapter
+from typing import Literal, Optional
+import logging
+import time
+from ..database.database import get_async_db
+from sqlalchemy import select, update, delete, insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..oauth2 import get_current_user
-from pinecone import Pinecone
-import os
-from dotenv import load_dotenv 
-from openai import OpenAI
-from datetime import timezone
+from ..ratelimit.ratelimit import BULK, EMBED, limit, rate_limiter
+from ..indexing.indexing import CREATE, DELETE, UPDATE, add_outbox, index_status, note_indexer, outbox_rows
+from ..cache.cache import answer_cache, note_text_cache, response_cache
+from ..utils.bulk import BULK_INSERT_CHUNK, parse_bulk_items
+from ..search.search import fulltext_search
+from ..utils.etag import etag_headers, etag_matches, make_etag, not_modified, request_key
+from ..utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_select, next_cursor, ndjson_response, parse_fields
+from ..utils.serialization import RowSerializer
 
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-if not PINECONE_API_KEY:
-    raise ValueError("Missing PINECONE_API_KEY")
-
-client = OpenAI()
 router = APIRouter(prefix="/notes", tags=["Notes"])
 
 
 
+NOTE_FIELDS = ("id", "title", "content", "create_at", "user_id")
+
+# What response_model would do, but yielding bytes that can be cached
+_note_adapter = TypeAdapter(NotesResponse)
+note_rows = RowSerializer(NotesResponse)
+
+
+# --------------------------------------------------
+# NOTES VERSION (ETags)
+# --------------------------------------------------
+
+async def notes_version(db: AsyncSession, user_id: int) -> int:
+    return await db.scalar(select(models.User.notes_version).where(models.User.id == user_id)) or 0
+
+
+async def bump_notes_version(db: AsyncSession, user_id: int):
+    # Call inside the transaction that changes the notes
+    await db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(notes_version=models.User.notes_version + 1)
+    )
+
+
+async def conditional_get(request: Request, db: AsyncSession, user_id: int, *resource):
+    # Returns (etag, version, ready response or None). A matching
+    # If-None-Match or a cached body costs one primary-key lookup.
+    # resource names what the ETag covers, e.g. ("notes",) or ("note", id).
+    version = await notes_version(db, user_id)
+    etag = make_etag(*resource, user_id, version)
+    if etag_matches(request, etag):
+        return etag, version, not_modified(etag)
+    return etag, version, response_cache.get(user_id, request_key(request), version)
+
+
+def notes_changed(user_id: int):
+    answer_cache.invalidate_user(user_id)
+    response_cache.invalidate_user(user_id)
+
+
 @router.get("/", response_model=list[NotesResponse])
-async def read_notes(db: Session = Depends(get_db),current_user=Depends(get_current_user)):
-    
-    if current_user.role == "Admin":
-        notes = db.query(models.Notes).all()
-    else:
-        notes = (db.query(models.Notes).filter(models.Notes.user_id == current_user.id).all())
+async def read_notes(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated subset of note fields, e.g. id,title,create_at"),
+    format: Literal["json", "ndjson"] = "json",
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user)
+):
+    projection = parse_fields(fields, NOTE_FIELDS)
+
+    # Admins see every note, users only their own
+    scope = [] if current_user.role == "Admin" else [models.Notes.user_id == current_user.id]
+    stmt = keyset_select(models.Notes, projection or list(NOTE_FIELDS), cursor, *scope)
+
+    # Streamed export of everything after the cursor
+    if format == "ndjson":
+        return ndjson_response(stmt, projection or list(NOTE_FIELDS))
 
-    return notes
+    # Admins list every user's notes, which no single version covers
+    etag = None
+    if current_user.role != "Admin":
+        etag, version, ready = await conditional_get(request, db, current_user.id, "notes")
+        if ready:
+            return ready
+
+    rows, next_page = next_cursor((await db.execute(stmt.limit(limit + 1))).all(), limit)
+    headers = {"X-Next-Cursor": next_page} if next_page else {}
+
+    response = note_rows.response(rows, projection, headers)
+
+    if etag:
+        response.headers.update(etag_headers(etag))
+        response_cache.put(current_user.id, request_key(request), version, response)
+    return response
 
 
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=NotesResponse)
-def write_note(
+async def write_note(
     notes: NotesCreate,
-    db: Session = Depends(get_db),
-    current_user=Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(limit(EMBED))
 ):
     # 1️⃣ Save note in SQL
     new_note = models.Notes(
@@ -47,42 +118,137 @@ def write_note(
         user_id=current_user.id
     )
     db.add(new_note)
-    db.commit()
-    db.refresh(new_note)
-
-    # 2️⃣ Create embedding from content (and title if you want)
-    text_to_embed = f"{new_note.title}\n{new_note.content}"
+    await db.flush()
 
-    embedding_response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text_to_embed
-    )
+    # 2️⃣ Outbox row in the same transaction; the background indexer embeds
+    add_outbox(db, CREATE, note_id=new_note.id, user_id=current_user.id)
+    await bump_notes_version(db, current_user.id)
+    await db.commit()
+    await db.refresh(new_note)
+    note_indexer.wake()
 
-    embedding_vector = embedding_response.data[0].embedding
-
-    # 3️⃣ Send to Pinecone
-    pinecone_index.upsert(
-        vectors=[
-            {
-                "id": f"note-{new_note.id}",
-                "values": embedding_vector,
-                "metadata": {
-                    "user_id": new_note.user_id,
-                    "created_at": new_note.create_at.replace(tzinfo=timezone.utc).isoformat(),
-                     "text": text_to_embed  # ✅ THIS WAS MISSING
-                }
-            }
-        ]
-    )
+    # A new note can change answers that previously said "I don't know"
+    notes_changed(current_user.id)
 
     return new_note
 
 
 
-@router.get("/{id}", response_model=NotesResponse)
-async def get_notes(id: int,db: Session = Depends(get_db),current_user=Depends(get_current_user)
+@router.post(
+    "/bulk",
+    status_code=status.HTTP_201_CREATED,
+    response_model=BulkImportResponse,
+    openapi_extra={"requestBody": {"content": {
+        "application/json": {"schema": {"type": "array", "items": NotesCreate.model_json_schema()}},
+        "application/x-ndjson": {"schema": {"type": "string"}},
+        "multipart/form-data": {"schema": {"type": "object", "properties": {"file": {"type": "string", "format": "binary"}}}},
+    }}}
+)
+async def bulk_import_notes(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user)
 ):
-    note = db.query(models.Notes).filter(models.Notes.id == id,models.Notes.user_id == current_user.id).first()
+    # Accepts a JSON array, NDJSON, or a file upload of either
+    started = time.perf_counter()
+    results = []
+    pending = []
+    limited = None  # the 429 once the user's bulk budget is spent
+
+    async def flush():
+        nonlocal limited
+        # Every imported note is embedded later; charge the chunk up front
+        if limited is None:
+            try:
+                await rate_limiter.check(current_user.id, BULK, cost=len(pending))
+            except HTTPException as e:
+                if e.status_code != status.HTTP_429_TOO_MANY_REQUESTS:
+                    raise
+                limited = e
+        if limited is not None:
+            retry_after = limited.headers["Retry-After"]
+            results.extend(
+                {"index": index, "status": "error", "error": f"Bulk import rate limit reached; retry in {retry_after}s"}
+                for index, _ in pending
+            )
+            pending.clear()
+            return
+
+        try:
+            # 1️⃣ One multi-row INSERT ... RETURNING per chunk
+            rows = (await db.execute(
+                insert(models.Notes).returning(
+                    models.Notes.id, models.Notes.user_id,
+                    sort_by_parameter_order=True
+                ),
+                [{**note.dict(), "user_id": current_user.id} for _, note in pending]
+            )).all()
+
+            # 2️⃣ Matching outbox rows, committed together with the notes
+            await db.execute(insert(models.IndexOutbox), outbox_rows(CREATE, rows))
+            await bump_notes_version(db, current_user.id)
+            await db.commit()
+        except DBAPIError as e:
+            # Earlier chunks are committed: report this one and go on
+            await db.rollback()
+            logger.warning("Bulk import chunk of %d notes failed: %s", len(pending), e.orig)
+            results.extend(
+                {"index": index, "status": "error", "error": "Database rejected this chunk of notes"}
+                for index, _ in pending
+            )
+            pending.clear()
+            return
+        note_indexer.wake()
+
+        for (index, _), row in zip(pending, rows):
+            results.append({"index": index, "status": "created", "id": row.id})
+        pending.clear()
+
+    async for index, item in parse_bulk_items(request):
+        if isinstance(item, str):
+            results.append({"index": index, "status": "error", "error": item})
+            continue
+        pending.append((index, item))
+        if len(pending) >= BULK_INSERT_CHUNK:
+            await flush()
+
+    if pending:
+        await flush()
+
+    # Nothing imported at all: a plain 429 with Retry-After
+    if limited is not None and not any(r["status"] == "created" for r in results):
+        raise limited
+
+    notes_changed(current_user.id)
+
+    created = sum(1 for r in results if r["status"] == "created")
+    seconds = time.perf_counter() - started
+    return {
+        "created": created,
+        "failed": len(results) - created,
+        "seconds": round(seconds, 3),
+        "notes_per_second": round(created / seconds, 1) if seconds else 0.0,
+        "items": sorted(results, key=lambda r: r["index"])
+    }
+
+
+
+@router.get("/search", response_model=list[NoteSearchResult])
+async def search_notes(
+    q: str = Query(..., min_length=1, description='Web-search syntax: words, "exact phrase", or, -exclude'),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user)
+):
+    # Keyword search over title + content, no embedding involved
+    scope = None if current_user.role == "Admin" else current_user.id
+    rows = await fulltext_search(db, q, limit, user_id=scope)
+    return [row._mapping for row in rows]
+
+
+
+async def get_own_note(db: AsyncSession, id: int, user_id: int):
+    note = await db.scalar(select(models.Notes).where(models.Notes.id == id,models.Notes.user_id == user_id))
 
     if not note:
         raise HTTPException(
@@ -94,15 +260,43 @@ async def get_notes(id: int,db: Session = Depends(get_db),current_user=Depends(g
 
 
 
+@router.get("/{id}", response_model=NotesResponse)
+async def get_notes(id: int,request: Request,db: AsyncSession = Depends(get_async_db),current_user=Depends(get_current_user)
+):
+    etag, version, ready = await conditional_get(request, db, current_user.id, "note", id)
+    if ready:
+        return ready
+
+    note = await get_own_note(db, id, current_user.id)
+    response = Response(
+        _note_adapter.dump_json(_note_adapter.validate_python(note, from_attributes=True)),
+        media_type="application/json",
+        headers=etag_headers(etag)
+    )
+    response_cache.put(current_user.id, request_key(request), version, response)
+    return response
+
+
+
+
+@router.get("/{id}/index-status", response_model=IndexStatus)
+async def get_index_status(id: int,db: AsyncSession = Depends(get_async_db),current_user=Depends(get_current_user)
+):
+    await get_own_note(db, id, current_user.id)
+
+    state = await index_status(db, id)
+    return {"note_id": id, "status": state.status, "updated_at": state.updated_at, "error": state.error}
+
+
+
 
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_notes(
     id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user)
 ):
-    note_query = db.query(models.Notes).filter(models.Notes.id == id)
-    note = note_query.first()
+    note = await db.get(models.Notes, id)
 
     if not note:
         raise HTTPException(status_code=404, detail="Post not found")
@@ -111,16 +305,18 @@ async def delete_notes(
     if current_user.role != "Admin" and note.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    # 1️⃣ Delete from Pinecone
-    try:
-        pinecone_index.delete(ids=[f"note-{note.id}"])
-    except Exception as e:
-        # Log but don't block deletion
-        print(f"Pinecone delete failed for note {note.id}: {e}")
+    # 1️⃣ Delete from SQL and queue the vector delete in the same transaction
+    await db.execute(delete(models.Notes).where(models.Notes.id == id))
+    add_outbox(db, DELETE, note_id=id, user_id=note.user_id)
+    await bump_notes_version(db, note.user_id)
+    await db.commit()
+
+    # 2️⃣ The background indexer removes every chunk of the note
+    note_indexer.wake()
 
-    # 2️⃣ Delete from SQL
-    note_query.delete(synchronize_session=False)
-    db.commit()
+    answer_cache.invalidate_notes([id])
+    note_text_cache.invalidate([id])
+    response_cache.invalidate_user(note.user_id)
 
     return responses.Response(status_code=204)
 
@@ -131,11 +327,10 @@ async def delete_notes(
 async def update_notes(
     id: int,
     notes: NotesCreate,
-    db: Session = Depends(get_db),
-    current_user=Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(limit(EMBED))
 ):
-    note_query = db.query(models.Notes).filter(models.Notes.id == id)
-    note = note_query.first()
+    note = await db.get(models.Notes, id)
 
     if not note:
         raise HTTPException(status_code=404, detail="Post not found")
@@ -144,33 +339,18 @@ async def update_notes(
     if current_user.role != "Admin" and note.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    # 1️⃣ Update SQL
-    note_query.update(notes.dict(), synchronize_session=False)
-    db.commit()
-    db.refresh(note)
+    # 1️⃣ Update SQL together with its outbox row
+    await db.execute(update(models.Notes).where(models.Notes.id == id).values(**notes.dict()))
+    add_outbox(db, UPDATE, note_id=id, user_id=note.user_id)
+    await bump_notes_version(db, note.user_id)
+    await db.commit()
+    await db.refresh(note)
 
-    # 2️⃣ Recreate embedding
-    text_to_embed = f"{note.title}\n{note.content}"
+    # 2️⃣ Re-embed in the background; chunks the new text no longer needs are dropped
+    note_indexer.wake()
 
-    embedding_response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text_to_embed
-    )
-    embedding_vector = embedding_response.data[0].embedding
-
-    # 3️⃣ Update Pinecone (same vector ID)
-    pinecone_index.upsert(
-        vectors=[
-            {
-                "id": f"note-{note.id}",
-                "values": embedding_vector,
-                "metadata": {
-                    "user_id": note.user_id,
-                    "created_at": note.create_at.replace(tzinfo=timezone.utc).isoformat(),
-                    "text": text_to_embed
-                }
-            }
-        ]
-    )
+    answer_cache.invalidate_notes([note.id])
+    note_text_cache.invalidate([note.id])
+    response_cache.invalidate_user(note.user_id)
 
     return note
@@ -1,33 +1,33 @@
 from ..models import models
-from ..schemas.schemas import UserCreate, UserResponse
-from ..utils.utils import hash_password
-from fastapi import responses, status, HTTPException, Depends, APIRouter
-from ..database.database import get_db
+from ..schemas.schemas import UserCreate, UserResponse, UserDeletionStatus
+from ..utils.utils import hash_password_async
+from fastapi import status, HTTPException, Depends, APIRouter, Query
+from ..database.database import get_db, get_async_db
+from ..indexing.indexing import DELETE_USER, add_outbox, deletion_status, note_indexer
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
-from ..oauth2 import get_current_user
-from pinecone import Pinecone
-import os
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Literal, Optional
+from ..oauth2 import get_current_user, get_admin_user
+from ..cache.cache import answer_cache, note_text_cache, principal_cache
+from ..utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_select, next_cursor, ndjson_response, parse_fields
+from ..utils.serialization import RowSerializer
 
 
 
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-pc = Pinecone(api_key=PINECONE_API_KEY)
-
-INDEX_NAME = "notes-api"  # must be lowercase
-index = pc.Index(INDEX_NAME)
-
 # CREATE USER (public)
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=UserResponse)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
-    user.password = hash_password(user.password)
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    user.password = await hash_password_async(user.password)
 
     new_user = models.User(**user.dict())
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     return new_user
 
@@ -35,7 +35,7 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
 # GET USER BY ID
 @router.get("/{id}", response_model=UserResponse)
 def get_user(id: int, db: Session = Depends(get_db),current_user = Depends(get_current_user)):
-    user = db.query(models.User).filter(models.User.id == id).first()
+    user = db.query(models.User).filter(models.User.id == id, models.User.deleted_at.is_(None)).first()
 
     if not user:
         raise HTTPException(
@@ -46,25 +46,44 @@ def get_user(id: int, db: Session = Depends(get_db),current_user = Depends(get_c
     return user
 
 
-# GET ALL USERS
+# GET ALL USERS (keyset-paginated, see utils/pagination.py)
+USER_FIELDS = ("id", "email", "create_at")
+
+user_rows = RowSerializer(UserResponse)
+
+
 @router.get("/", response_model=list[UserResponse])
-def get_users(db: Session = Depends(get_db),current_user = Depends(get_current_user)):
-    users = db.query(models.User).all()
-    return users
+async def get_users(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated subset of user fields"),
+    format: Literal["json", "ndjson"] = "json",
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+):
+    projection = parse_fields(fields, USER_FIELDS)
+    stmt = keyset_select(models.User, projection or list(USER_FIELDS), cursor, models.User.deleted_at.is_(None))
+
+    if format == "ndjson":
+        return ndjson_response(stmt, projection or list(USER_FIELDS))
+
+    rows, next_page = next_cursor((await db.execute(stmt.limit(limit + 1))).all(), limit)
+    headers = {"X-Next-Cursor": next_page} if next_page else {}
+
+    return user_rows.response(rows, projection, headers)
 
 
 # --------------------------------------------------
-# DELETE USER (admin OR self) + Pinecone cleanup
+# DELETE USER (admin OR self), purged in the background
 # --------------------------------------------------
 
-@router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(
+@router.delete("/{id}", status_code=status.HTTP_202_ACCEPTED, response_model=UserDeletionStatus)
+async def delete_user(
     id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user)
 ):
-    user_query = db.query(models.User).filter(models.User.id == id)
-    user = user_query.first()
+    user = await db.get(models.User, id)
 
     if not user:
         raise HTTPException(
@@ -80,22 +99,38 @@ def delete_user(
         )
 
     # --------------------------------------------------
-    # 1️⃣ Delete Pinecone vectors for this user
+    # 1️⃣ Mark the account deleted and queue the purge in one
+    #    transaction; repeating the request only reports progress
     # --------------------------------------------------
-    try:
-        index.delete(
-            filter={
-                "user_id": id
-            }
-        )
-    except Exception as e:
-        # Optional: log error instead of failing hard
-        print(f"Pinecone delete failed for user {id}: {e}")
+    if user.deleted_at is None:
+        await db.execute(update(models.User).where(models.User.id == id).values(deleted_at=func.now()))
+        await db.execute(insert(models.UserDeletion).values(user_id=id).on_conflict_do_nothing())
+        add_outbox(db, DELETE_USER, user_id=id)
+        await db.commit()
+
+        # --------------------------------------------------
+        # 2️⃣ The background indexer deletes notes and vectors
+        #    in batches, then the user row
+        # --------------------------------------------------
+        note_indexer.wake()
+
+    principal_cache.invalidate(id)
+    answer_cache.invalidate_user(id)
+    note_text_cache.invalidate_user(id)
+
+    return await deletion_status(db, id)
 
-    # --------------------------------------------------
-    # 2️⃣ Delete user from SQL (CASCADE deletes notes)
-    # --------------------------------------------------
-    user_query.delete(synchronize_session=False)
-    db.commit()
 
-    return responses.Response(status_code=status.HTTP_204_NO_CONTENT)
+@router.get("/{id}/deletion", response_model=UserDeletionStatus)
+async def get_deletion_status(
+    id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_admin_user)
+):
+    state = await deletion_status(db, id)
+    if state is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No deletion requested for this user"
+        )
+    return state
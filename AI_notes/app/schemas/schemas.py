@@ -1,6 +1,6 @@
-from pydantic import BaseModel,EmailStr
+from pydantic import BaseModel,EmailStr,Field,field_validator
 from datetime import datetime
-from typing import Optional
+from typing import Literal, Optional
 
 
 
@@ -18,6 +18,14 @@ class NotesCreate(BaseModel):
     title:str
     content:str
 
+    @field_validator("title", "content")
+    @classmethod
+    def no_nul(cls, value: str) -> str:
+        # Postgres text can't store NUL characters
+        if "\x00" in value:
+            raise ValueError("NUL characters are not allowed")
+        return value
+
 class Notes(BaseModel):
     title:str
     content:str
@@ -29,8 +37,51 @@ class NotesResponse(Notes):
     user_id:int  
     
 
+class NoteSearchResult(NotesResponse):
+    rank:float
+
+
+class IndexStatus(BaseModel):
+    note_id:int
+    status:str
+    updated_at:Optional[datetime] = None
+    error:Optional[str] = None
+
+
+class UserDeletionStatus(BaseModel):
+    user_id:int
+    status:Literal["pending", "purging", "done"]
+    requested_at:datetime
+    notes_purged:int
+    notes_remaining:int
+    finished_at:Optional[datetime] = None
+    error:Optional[str] = None
+
+
+class BulkItemResult(BaseModel):
+    index:int
+    status:str
+    id:Optional[int] = None
+    error:Optional[str] = None
+
+
+class BulkImportResponse(BaseModel):
+    created:int
+    failed:int
+    seconds:float
+    notes_per_second:float
+    items:list[BulkItemResult]
+
+
+class ProfilingSettings(BaseModel):
+    sample_rate:float = Field(ge=0, le=1)
+
+
 class QuestionRequest(BaseModel):
     question: str
+    # vector: embeddings only; keyword: full-text only (no embedding call);
+    # hybrid: both, fused by reciprocal rank
+    mode: Literal["vector", "keyword", "hybrid"] = "vector"
 
 class AI(Notes):
     pass
@@ -0,0 +1,68 @@
+import os
+import re
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import models
+from ..models.models import NOTES_SEARCH_CONFIG
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+
+# Reciprocal-rank fusion constant; larger values flatten the rank curve
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+_TERMS = re.compile(r'"[^"]+"|\w+', re.UNICODE)
+
+
+# --------------------------------------------------
+# FULL-TEXT SEARCH
+# --------------------------------------------------
+
+def search_query(q: str):
+    # websearch syntax: "exact phrase", or, -exclude
+    return func.websearch_to_tsquery(NOTES_SEARCH_CONFIG, q)
+
+
+def any_terms(question: str) -> str:
+    # A question rarely contains all of a note's words, so match any term
+    # (quoted phrases stay phrases); ts_rank_cd still favours notes that
+    # match more of them. Stop words are dropped by to_tsquery itself.
+    return " or ".join(_TERMS.findall(question))
+
+
+async def fulltext_search(
+    db: AsyncSession,
+    q: str,
+    limit: int,
+    user_id: Optional[int] = None,
+    columns: Optional[list] = None
+) -> list:
+    # Rows ranked by ts_rank_cd; served by the GIN index on search_vector
+    query = search_query(q)
+    rank = func.ts_rank_cd(models.Notes.search_vector, query).label("rank")
+    columns = columns or [models.Notes.id, models.Notes.title, models.Notes.content,
+                          models.Notes.create_at, models.Notes.user_id]
+
+    stmt = select(*columns, rank).where(models.Notes.search_vector.op("@@")(query))
+    if user_id is not None:
+        stmt = stmt.where(models.Notes.user_id == user_id)
+    stmt = stmt.order_by(rank.desc(), models.Notes.id).limit(limit)
+
+    return (await db.execute(stmt)).all()
+
+
+# --------------------------------------------------
+# FUSION
+# --------------------------------------------------
+
+def reciprocal_rank_fusion(*rankings: list, k: int = RRF_K) -> dict:
+    # score(id) = sum over rankings of 1 / (k + rank); ids come back best first
+    scores: dict = {}
+    for ranking in rankings:
+        for position, id in enumerate(ranking, start=1):
+            scores[id] = scores.get(id, 0.0) + 1.0 / (k + position)
+    return dict(sorted(scores.items(), key=lambda item: item[1], reverse=True))
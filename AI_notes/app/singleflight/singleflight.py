@@ -0,0 +1,67 @@
+import asyncio
+from collections.abc import Hashable
+from functools import partial
+from typing import Any, Optional
+
+
+# --------------------------------------------------
+# SINGLE-FLIGHT
+# --------------------------------------------------
+# Concurrent requests for the same key share one execution: the first
+# caller leads and resolves the flight, later callers wait for its result
+# (or error). Flights are forgotten once resolved, so this never serves
+# stale results; caching stays the caches' job.
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def in_flight(self, key: Hashable) -> Optional[asyncio.Future]:
+        return self._flights.get(key)
+
+    def begin(self, key: Hashable) -> asyncio.Future:
+        # The caller must finish() or fail() the returned flight
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        self.leaders += 1
+        flight.add_done_callback(partial(self._forget, key))
+        return flight
+
+    def _forget(self, key: Hashable, flight: asyncio.Future):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Nobody may be waiting; don't log "exception was never retrieved"
+        if not flight.cancelled():
+            flight.exception()
+
+    async def wait(self, flight: asyncio.Future) -> Any:
+        # shield: a follower that disconnects doesn't cancel the flight
+        self.followers += 1
+        return await asyncio.shield(flight)
+
+    @staticmethod
+    def finish(flight: asyncio.Future, result: Any):
+        if not flight.done():
+            flight.set_result(result)
+
+    @staticmethod
+    def fail(flight: asyncio.Future, error: BaseException):
+        if not flight.done():
+            # Followers can't be cancelled on the leader's behalf
+            if not isinstance(error, Exception):
+                error = RuntimeError(f"leader stopped: {error!r}")
+            flight.set_exception(error)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
+
+
+ask_flights = SingleFlight("ask")
@@ -0,0 +1,104 @@
+import json
+import os
+from typing import AsyncIterator, Union
+
+from fastapi import HTTPException, Request, status
+from starlette.datastructures import UploadFile
+from pydantic import ValidationError
+
+from ..schemas.schemas import NotesCreate
+
+# Rows per multi-row INSERT ... RETURNING statement
+BULK_INSERT_CHUNK = int(os.getenv("BULK_INSERT_CHUNK", "500"))
+
+# Upper bound on notes accepted by one bulk request
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "100000"))
+
+READ_CHUNK_BYTES = 64 * 1024
+
+
+# --------------------------------------------------
+# INPUT STREAMS
+# --------------------------------------------------
+
+async def _body_chunks(request: Request) -> AsyncIterator[bytes]:
+    content_type = request.headers.get("content-type", "")
+
+    # Multipart: the first uploaded file, read in fixed-size chunks
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = next((v for v in form.values() if isinstance(v, UploadFile)), None)
+        if upload is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Multipart upload needs a file field"
+            )
+        while chunk := await upload.read(READ_CHUNK_BYTES):
+            yield chunk
+        return
+
+    async for chunk in request.stream():
+        yield chunk
+
+
+async def iter_bulk_items(request: Request) -> AsyncIterator[Union[bytes, object]]:
+    # A body whose first non-blank byte is "[" is a JSON array; anything
+    # else is NDJSON and is yielded line by line as it arrives.
+    buffer = b""
+    parts = []
+    is_array = None
+
+    async for chunk in _body_chunks(request):
+        if is_array:
+            parts.append(chunk)
+            continue
+
+        buffer += chunk
+        if is_array is None:
+            stripped = buffer.lstrip()
+            if not stripped:
+                continue
+            is_array = stripped.startswith(b"[")
+            if is_array:
+                parts.append(buffer)
+                continue
+
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+
+    if is_array:
+        try:
+            items = json.loads(b"".join(parts))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid JSON: {e}")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a JSON array")
+        for item in items:
+            yield item
+    elif buffer.strip():
+        yield buffer
+
+
+async def parse_bulk_items(request: Request) -> AsyncIterator[tuple[int, Union[NotesCreate, str]]]:
+    # Yields (index, note) or (index, error message) per input item
+    index = 0
+    async for raw in iter_bulk_items(request):
+        if index >= BULK_MAX_ITEMS:
+            # Earlier chunks are already committed, so report rather than fail
+            yield index, f"Limit of {BULK_MAX_ITEMS} notes per request reached; remaining input ignored"
+            return
+        try:
+            item = json.loads(raw) if isinstance(raw, bytes) else raw
+            yield index, NotesCreate.model_validate(item)
+        except ValueError as e:
+            # json.JSONDecodeError and pydantic's ValidationError both land here
+            yield index, _short_error(e)
+        index += 1
+
+
+def _short_error(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors())
+    return str(error)
@@ -0,0 +1,37 @@
+from fastapi import Request, Response, status
+
+# Clients may keep the body but must revalidate before using it
+ETAG_CACHE_CONTROL = "private, no-cache"
+
+
+# --------------------------------------------------
+# ETAGS / CONDITIONAL GET
+# --------------------------------------------------
+
+def make_etag(*parts) -> str:
+    # Weak: equal versions mean equal content, not byte-identical encoding
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+
+def etag_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": ETAG_CACHE_CONTROL}
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    # If-None-Match uses weak comparison: W/"x" matches "x"
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=etag_headers(etag))
+
+
+def request_key(request: Request) -> str:
+    # Path plus query: one cached representation per distinct URL
+    return f"{request.url.path}?{request.url.query}"
@@ -0,0 +1,89 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, tuple_
+
+from ..database.database import AsyncSessionLocal
+from .serialization import dump_row_json, project
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Rows fetched per round trip when streaming NDJSON exports
+EXPORT_BATCH_SIZE = 1000
+
+
+# --------------------------------------------------
+# CURSORS  (opaque base64 of [create_at, id])
+# --------------------------------------------------
+
+def encode_cursor(create_at: datetime, id: int) -> str:
+    raw = json.dumps([create_at.isoformat(), id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        create_at, id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(create_at), int(id)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+# --------------------------------------------------
+# PROJECTION
+# --------------------------------------------------
+
+def parse_fields(fields: Optional[str], allowed: tuple[str, ...]) -> Optional[list[str]]:
+    if not fields:
+        return None
+
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields {unknown}; allowed: {list(allowed)}"
+        )
+    return requested
+
+
+def keyset_select(model, fields: list[str], cursor: Optional[str], *where):
+    # Always select the sort key so the next cursor can be built
+    columns = [getattr(model, name) for name in dict.fromkeys(fields + ["create_at", "id"])]
+
+    stmt = select(*columns).where(*where)
+    if cursor:
+        stmt = stmt.where(tuple_(model.create_at, model.id) > decode_cursor(cursor))
+    return stmt.order_by(model.create_at, model.id)
+
+
+def next_cursor(rows: list, limit: int) -> tuple[list, Optional[str]]:
+    # Pages are fetched with limit + 1 rows to know whether more exist
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].create_at, rows[-1].id)
+
+
+# --------------------------------------------------
+# NDJSON EXPORT
+# --------------------------------------------------
+
+def ndjson_response(stmt, fields: list[str]) -> StreamingResponse:
+    async def rows():
+        # The request's session is closed once the handler returns, so the
+        # export owns its own session and streams with a server-side cursor.
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            async for row in result:
+                yield dump_row_json(project(row, fields)) + b"\n"
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
@@ -0,0 +1,57 @@
+import os
+from typing import Optional
+
+import orjson
+from dotenv import load_dotenv
+from fastapi import Response
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+load_dotenv()
+
+# Opt-in: orjson as the app's default response class, and list pages of
+# trusted DB rows encoded straight from the row tuples instead of being
+# validated through the response model row by row
+FAST_SERIALIZATION = os.getenv("FAST_SERIALIZATION", "false").lower() == "true"
+
+# Same spelling of UTC datetimes as pydantic ("...Z", not "+00:00")
+ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+
+def default_response_class() -> type[JSONResponse]:
+    return ORJSONResponse if FAST_SERIALIZATION else JSONResponse
+
+
+def project(row, fields: list[str]) -> dict:
+    mapping = row._mapping
+    return {name: mapping[name] for name in fields}
+
+
+def dump_row_json(value) -> bytes:
+    # Row dicts (projections, NDJSON lines) encoded like the response models
+    return orjson.dumps(value, option=ORJSON_OPTIONS)
+
+
+# --------------------------------------------------
+# LIST PAGES
+# --------------------------------------------------
+
+class RowSerializer:
+    # Renders keyset pages (row tuples from keyset_select) for one
+    # response model. Every path gives the same JSON encoding: datetimes in
+    # pydantic's format, full rows with fields in the model's order.
+    def __init__(self, model: type[BaseModel], trusted: bool = FAST_SERIALIZATION):
+        self.fields = list(model.model_fields)
+        self.trusted = trusted
+        self._adapter = TypeAdapter(list[model])
+
+    def render(self, rows: list, projection: Optional[list[str]] = None) -> bytes:
+        items = [project(row, projection or self.fields) for row in rows]
+        # Trusted rows have the model's types already; partial rows can't
+        # be validated against the full model
+        if self.trusted or projection:
+            return dump_row_json(items)
+        return self._adapter.dump_json(self._adapter.validate_python(items))
+
+    def response(self, rows: list, projection: Optional[list[str]] = None, headers: Optional[dict] = None) -> Response:
+        return Response(self.render(rows, projection), media_type="application/json", headers=headers)
@@ -1,6 +1,34 @@
 from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, status
+from dotenv import load_dotenv
+import asyncio
+import os
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from ..metrics.metrics import BCRYPT, timed
+
+load_dotenv()
+
+# bcrypt cost factor. Hashes made with any other cost are re-hashed on the
+# next successful login (min == max == default marks them as outdated).
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# bcrypt releases the GIL, so a thread per core gives real parallelism
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+
+# Hash/verify jobs allowed to wait for the pool before we shed load with 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 16)))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_pending = 0
 
 
 def hash_password(password: str):
@@ -13,4 +41,36 @@ def hash_password(password: str):
 
 
 def verify(plain_password,hash_password):
-    return pwd_context.verify(plain_password,hash_password)
\ No newline at end of file
+    return pwd_context.verify(plain_password,hash_password)
+
+
+# --------------------------------------------------
+# ASYNC WRAPPERS (keep bcrypt off the event loop)
+# --------------------------------------------------
+
+async def _run_in_pool(fn, *args):
+    global _pending
+    if _pending >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent logins, try again shortly",
+            headers={"Retry-After": "1"}
+        )
+
+    _pending += 1
+    try:
+        # Includes time queued behind other hashes, which is what callers feel
+        with timed(BCRYPT):
+            return await asyncio.get_running_loop().run_in_executor(_hash_pool, fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_in_pool(hash_password, password)
+
+
+async def verify_and_update_async(plain_password, hashed_password):
+    # Returns (valid, new_hash); new_hash is set when the stored hash used
+    # an outdated cost and should be replaced.
+    return await _run_in_pool(pwd_context.verify_and_update, plain_password, hashed_password)
@@ -0,0 +1,431 @@
+import asyncio
+import os
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from ..metrics.metrics import VECTOR_DELETE, VECTOR_LIST, VECTOR_QUERY, VECTOR_UPSERT, timed
+
+load_dotenv()
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+
+# "pinecone" (default) or "local" for the in-process NumPy index
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+
+INDEX_NAME = "notes-api"
+EMBEDDING_DIMENSION = 1536  # example: OpenAI text-embedding-3-small
+
+# Pinecone rejects upsert requests much larger than ~100 vectors / 2MB
+UPSERT_CHUNK_SIZE = 100
+
+# Pinecone accepts at most 1000 ids per delete request
+DELETE_CHUNK_SIZE = 1000
+
+# Fetch returns the values too; keep each response small
+FETCH_CHUNK_SIZE = 100
+
+
+# --------------------------------------------------
+# RESULT TYPES (same shape as Pinecone's query response)
+# --------------------------------------------------
+
+@dataclass
+class Match:
+    id: str
+    score: float
+    metadata: dict = field(default_factory=dict)
+
+
+@dataclass
+class QueryResult:
+    matches: list[Match] = field(default_factory=list)
+
+
+def _matches_filter(metadata: dict, filter: Optional[dict]) -> bool:
+    # Supports the subset of Pinecone's filter language we use:
+    # {"field": value} and {"field": {"$eq"|"$ne"|"$in"|"$nin": ...}}
+    if not filter:
+        return True
+
+    for key, condition in filter.items():
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, expected in condition.items():
+            if op == "$eq" and value != expected:
+                return False
+            if op == "$ne" and value == expected:
+                return False
+            if op == "$in" and value not in expected:
+                return False
+            if op == "$nin" and value in expected:
+                return False
+    return True
+
+
+# --------------------------------------------------
+# INTERFACE
+# --------------------------------------------------
+
+class VectorStore(ABC):
+    @abstractmethod
+    def upsert(self, vectors: list[dict]) -> None:
+        ...
+
+    @abstractmethod
+    def query(
+        self,
+        vector: list[float],
+        top_k: int,
+        filter: Optional[dict] = None,
+        include_metadata: bool = True
+    ) -> QueryResult:
+        ...
+
+    @abstractmethod
+    def delete(self, ids: Optional[list[str]] = None, filter: Optional[dict] = None) -> None:
+        ...
+
+    @abstractmethod
+    def list_ids(self, prefix: str) -> list[str]:
+        ...
+
+    @abstractmethod
+    def existing_ids(self, ids: list[str]) -> set[str]:
+        # The subset of ids that are stored
+        ...
+
+    def iter_id_pages(self, prefix: str, page_size: int = 1000):
+        # Yields lists of ids; backends that page natively override this
+        ids = self.list_ids(prefix)
+        for start in range(0, len(ids), page_size):
+            yield ids[start:start + page_size]
+
+    def delete_ids(self, ids: list[str]) -> None:
+        # Explicit id deletes in request-sized chunks
+        for start in range(0, len(ids), DELETE_CHUNK_SIZE):
+            self.delete(ids=ids[start:start + DELETE_CHUNK_SIZE])
+
+    def delete_prefix(self, prefix: str, keep: Optional[set] = None) -> None:
+        # Removes every vector whose id starts with prefix (e.g. all chunks
+        # of one note), except the ids in keep
+        self.delete_ids([id for id in self.list_ids(prefix) if not keep or id not in keep])
+
+    # Async variants for request handlers. Both backends are blocking
+    # (HTTP client / NumPy), so they run on a worker thread by default.
+    async def aupsert(self, vectors: list[dict]) -> None:
+        await asyncio.to_thread(self.upsert, vectors)
+
+    async def aquery(
+        self,
+        vector: list[float],
+        top_k: int,
+        filter: Optional[dict] = None,
+        include_metadata: bool = True
+    ) -> QueryResult:
+        return await asyncio.to_thread(self.query, vector, top_k, filter, include_metadata)
+
+    async def adelete(self, ids: Optional[list[str]] = None, filter: Optional[dict] = None) -> None:
+        await asyncio.to_thread(self.delete, ids, filter)
+
+    async def adelete_prefix(self, prefix: str, keep: Optional[set] = None) -> None:
+        await asyncio.to_thread(self.delete_prefix, prefix, keep)
+
+
+# --------------------------------------------------
+# PINECONE ADAPTER
+# --------------------------------------------------
+
+def provision_pinecone_index(api_key: str, index_name: str = INDEX_NAME, dimension: int = EMBEDDING_DIMENSION) -> bool:
+    # Run from the CLI (python -m app.cli create-index), never at startup.
+    # Returns True if the index had to be created.
+    from pinecone import Pinecone, ServerlessSpec
+
+    pc = Pinecone(api_key=api_key)
+
+    # Check if index exists, else create
+    existing_indexes = [index["name"] for index in pc.list_indexes()]
+
+    if index_name in existing_indexes:
+        return False
+
+    pc.create_index(
+        name=index_name,
+        dimension=dimension,
+        metric="cosine",
+        spec=ServerlessSpec(
+            cloud="aws",
+            region="us-east-1"
+        )
+    )
+    return True
+
+
+class PineconeVectorStore(VectorStore):
+    def __init__(self, api_key: str, index_name: str = INDEX_NAME, host: Optional[str] = None):
+        from pinecone import Pinecone
+
+        # With PINECONE_HOST set the SDK skips the describe_index lookup
+        pc = Pinecone(api_key=api_key)
+        self.index = pc.Index(index_name, host=host) if host else pc.Index(index_name)
+
+    def upsert(self, vectors: list[dict]) -> None:
+        for start in range(0, len(vectors), UPSERT_CHUNK_SIZE):
+            self.index.upsert(vectors=vectors[start:start + UPSERT_CHUNK_SIZE])
+
+    def query(self, vector, top_k, filter=None, include_metadata=True) -> QueryResult:
+        response = self.index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=include_metadata,
+            filter=filter
+        )
+        return QueryResult(matches=[
+            Match(id=m.id, score=m.score, metadata=dict(m.metadata or {}))
+            for m in response.matches
+        ])
+
+    def delete(self, ids=None, filter=None) -> None:
+        if ids is not None:
+            self.index.delete(ids=ids)
+        elif filter is not None:
+            self.index.delete(filter=filter)
+
+    def list_ids(self, prefix: str) -> list[str]:
+        ids = []
+        for page in self.iter_id_pages(prefix):
+            ids.extend(page)
+        return ids
+
+    def iter_id_pages(self, prefix: str, page_size: int = 100):
+        # Serverless indexes page through ids by prefix (at most 100 per page)
+        yield from self.index.list(prefix=prefix, limit=min(page_size, 100))
+
+    def existing_ids(self, ids: list[str]) -> set[str]:
+        found = set()
+        for start in range(0, len(ids), FETCH_CHUNK_SIZE):
+            found.update(self.index.fetch(ids=ids[start:start + FETCH_CHUNK_SIZE]).vectors)
+        return found
+
+
+# --------------------------------------------------
+# LOCAL (IN-PROCESS) BACKEND
+# --------------------------------------------------
+
+class _Partition:
+    # Rows live in one contiguous float32 matrix that grows by doubling;
+    # deletes swap the last row into the freed slot.
+    def __init__(self, dimension: int):
+        self.matrix = np.empty((16, dimension), dtype=np.float32)
+        self.ids: list[str] = []
+        self.metadata: list[dict] = []
+        self.rows: dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def put(self, id: str, values: np.ndarray, metadata: dict):
+        row = self.rows.get(id)
+        if row is None:
+            row = len(self.ids)
+            if row == self.matrix.shape[0]:
+                grown = np.empty((row * 2, self.matrix.shape[1]), dtype=np.float32)
+                grown[:row] = self.matrix[:row]
+                self.matrix = grown
+            self.ids.append(id)
+            self.metadata.append(metadata)
+            self.rows[id] = row
+        else:
+            self.metadata[row] = metadata
+        self.matrix[row] = values
+
+    def remove(self, id: str):
+        row = self.rows.pop(id, None)
+        if row is None:
+            return
+        last = len(self.ids) - 1
+        if row != last:
+            self.matrix[row] = self.matrix[last]
+            self.ids[row] = self.ids[last]
+            self.metadata[row] = self.metadata[last]
+            self.rows[self.ids[row]] = row
+        self.ids.pop()
+        self.metadata.pop()
+
+
+class LocalVectorStore(VectorStore):
+    # Exact (brute-force) cosine search over per-user partitions. Queries
+    # in this app are always scoped to one user, so each search is a single
+    # matrix-vector product over that user's notes.
+    def __init__(self, dimension: int = EMBEDDING_DIMENSION, partition_key: str = "user_id"):
+        self.dimension = dimension
+        self.partition_key = partition_key
+        self._partitions: dict[Any, _Partition] = {}
+        self._locations: dict[str, Any] = {}
+        self._lock = threading.RLock()
+
+    def _normalize(self, values) -> np.ndarray:
+        vector = np.asarray(values, dtype=np.float32)
+        if vector.shape != (self.dimension,):
+            raise ValueError(f"Expected vector of dimension {self.dimension}, got {vector.shape}")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _partition_keys(self, filter: Optional[dict]) -> Optional[list]:
+        # Partitions a filter selects exactly, or None to search them all
+        condition = (filter or {}).get(self.partition_key)
+        if condition is None:
+            return None
+        if not isinstance(condition, dict):
+            return [condition]
+        if list(condition) == ["$eq"]:
+            return [condition["$eq"]]
+        if list(condition) == ["$in"]:
+            return list(condition["$in"])
+        return None
+
+    def _target_partitions(self, filter: Optional[dict]) -> list[_Partition]:
+        keys = self._partition_keys(filter)
+        if keys is None:
+            return list(self._partitions.values())
+        return [self._partitions[k] for k in keys if k in self._partitions]
+
+    def upsert(self, vectors: list[dict]) -> None:
+        with self._lock:
+            for item in vectors:
+                metadata = dict(item.get("metadata") or {})
+                key = metadata.get(self.partition_key)
+                values = self._normalize(item["values"])
+
+                # A vector that changed partition must leave the old one
+                previous = self._locations.get(item["id"])
+                if previous is not None and previous != key:
+                    self._partitions[previous].remove(item["id"])
+
+                partition = self._partitions.get(key)
+                if partition is None:
+                    partition = self._partitions[key] = _Partition(self.dimension)
+                partition.put(item["id"], values, metadata)
+                self._locations[item["id"]] = key
+
+    def query(self, vector, top_k, filter=None, include_metadata=True) -> QueryResult:
+        query_vector = self._normalize(vector)
+        candidates: list[tuple[float, str, dict]] = []
+
+        # Selecting the partitions already applies the partition-key term;
+        # rows are only checked against whatever else the filter asks
+        row_filter = filter
+        if filter and self._partition_keys(filter) is not None:
+            row_filter = {key: condition for key, condition in filter.items() if key != self.partition_key}
+
+        with self._lock:
+            for partition in self._target_partitions(filter):
+                size = len(partition)
+                if not size:
+                    continue
+
+                scores = partition.matrix[:size] @ query_vector
+                rows = np.arange(size)
+                if row_filter:
+                    keep = [r for r in rows if _matches_filter(partition.metadata[r], row_filter)]
+                    rows = np.asarray(keep, dtype=np.int64)
+                    if not len(rows):
+                        continue
+
+                k = min(top_k, len(rows))
+                top = rows[np.argpartition(-scores[rows], k - 1)[:k]]
+                candidates.extend(
+                    (float(scores[r]), partition.ids[r], partition.metadata[r]) for r in top
+                )
+
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        return QueryResult(matches=[
+            Match(id=id, score=score, metadata=dict(metadata) if include_metadata else {})
+            for score, id, metadata in candidates[:top_k]
+        ])
+
+    def delete(self, ids=None, filter=None) -> None:
+        with self._lock:
+            if ids is not None:
+                for id in ids:
+                    if id in self._locations:
+                        self._partitions[self._locations.pop(id)].remove(id)
+            elif filter is not None:
+                for partition in self._target_partitions(filter):
+                    doomed = [
+                        id for id, metadata in zip(partition.ids, partition.metadata)
+                        if _matches_filter(metadata, filter)
+                    ]
+                    for id in doomed:
+                        partition.remove(id)
+                        self._locations.pop(id, None)
+
+    def list_ids(self, prefix: str) -> list[str]:
+        with self._lock:
+            return [id for id in self._locations if id.startswith(prefix)]
+
+    def existing_ids(self, ids: list[str]) -> set[str]:
+        with self._lock:
+            return {id for id in ids if id in self._locations}
+
+
+# --------------------------------------------------
+# INSTRUMENTATION
+# --------------------------------------------------
+
+class InstrumentedVectorStore(VectorStore):
+    # Times every call of the wrapped backend per stage; the async variants
+    # inherited from VectorStore run these on a worker thread
+    def __init__(self, store: VectorStore):
+        self.store = store
+
+    def upsert(self, vectors):
+        with timed(VECTOR_UPSERT):
+            self.store.upsert(vectors)
+
+    def query(self, vector, top_k, filter=None, include_metadata=True) -> QueryResult:
+        with timed(VECTOR_QUERY):
+            return self.store.query(vector, top_k, filter, include_metadata)
+
+    def delete(self, ids=None, filter=None) -> None:
+        with timed(VECTOR_DELETE):
+            self.store.delete(ids, filter)
+
+    def list_ids(self, prefix: str) -> list[str]:
+        with timed(VECTOR_LIST):
+            return self.store.list_ids(prefix)
+
+    def iter_id_pages(self, prefix: str, page_size: int = 1000):
+        return self.store.iter_id_pages(prefix, page_size)
+
+    def existing_ids(self, ids: list[str]) -> set[str]:
+        with timed(VECTOR_LIST):
+            return self.store.existing_ids(ids)
+
+
+# --------------------------------------------------
+# FACTORY
+# --------------------------------------------------
+
+def pinecone_api_key() -> str:
+    PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+    if not PINECONE_API_KEY:
+        raise ValueError("Missing PINECONE_API_KEY")
+    return PINECONE_API_KEY
+
+
+def create_vector_store() -> VectorStore:
+    if VECTOR_BACKEND == "local":
+        return LocalVectorStore()
+
+    if VECTOR_BACKEND != "pinecone":
+        raise ValueError(f"Unknown VECTOR_BACKEND {VECTOR_BACKEND!r}")
+
+    return PineconeVectorStore(api_key=pinecone_api_key(), host=os.getenv("PINECONE_HOST"))
@@ -0,0 +1,55 @@
+"""Login throughput of the bcrypt hashing pool.
+
+Run from AI_notes/:
+
+    python -m benchmarks.bench_bcrypt --rounds 10 12 --logins 200
+
+Reports verified logins/sec overall and per core for each cost factor,
+going through the same thread pool the /login route uses.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from passlib.context import CryptContext
+
+
+async def run(rounds: int, logins: int, workers: int) -> float:
+    # Import late so BCRYPT_ROUNDS / PASSWORD_HASH_WORKERS apply
+    os.environ["BCRYPT_ROUNDS"] = str(rounds)
+    os.environ["PASSWORD_HASH_WORKERS"] = str(workers)
+    os.environ["PASSWORD_HASH_MAX_PENDING"] = str(logins)
+
+    import importlib
+    from app.utils import utils
+    utils = importlib.reload(utils)
+
+    stored = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds).hash("correct horse")
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        utils.verify_and_update_async("correct horse", stored) for _ in range(logins)
+    ))
+    elapsed = time.perf_counter() - started
+
+    assert all(valid for valid, _ in results)
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 12])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    cores = min(args.workers, os.cpu_count() or 1)
+    print(f"{'rounds':>6} {'workers':>7} {'logins/s':>10} {'per core':>10}")
+    for rounds in args.rounds:
+        rate = asyncio.run(run(rounds, args.logins, args.workers))
+        print(f"{rounds:>6} {args.workers:>7} {rate:>10.1f} {rate / cores:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Check the query plans of the hot notes/users queries.
+
+Run from AI_notes/:
+
+    python -m benchmarks.explain
+    python -m benchmarks.explain --users 2000 --notes-per-user 300
+    python -m benchmarks.explain --database-url postgresql://... --no-seed
+
+Creates the schema (init-db) in an ephemeral Postgres via the optional
+`pgserver` package unless --database-url is given, seeds a realistic
+number of users and notes with generate_series, runs ANALYZE, then
+EXPLAINs the queries the API issues on every request. Exits non-zero if
+any of them falls back to a sequential scan on notes or users. Keep the
+seed realistic: a table of a few pages is legitimately cheaper to scan.
+"""
+import argparse
+import os
+import sys
+import time
+
+from .load import benchmark_database
+
+# Tables that must never be scanned sequentially by a hot query
+CHECKED_TABLES = {"notes", "users"}
+
+WORDS = (
+    "kubernetes helm deploy budget invoice travel flight hotel recipe garlic "
+    "meeting roadmap sprint python fastapi postgres index latency cache queue"
+).split()
+
+
+# --------------------------------------------------
+# SEEDING
+# --------------------------------------------------
+
+def seed(engine, users: int, notes_per_user: int):
+    from sqlalchemy import text
+
+    words = "ARRAY[" + ", ".join(f"'{w}'" for w in WORDS) + "]"
+    run = str(int(time.time()))
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO users (email, password, role, create_at) "
+            "SELECT 'explain-' || :run || '-' || g || '@example.com', 'x', 'User', "
+            "now() - make_interval(mins => g) "
+            "FROM generate_series(1, :users) g"
+        ), {"run": run, "users": users})
+        conn.execute(text(
+            "INSERT INTO notes (title, content, user_id, create_at) "
+            f"SELECT 'note ' || n, "
+            f"({words})[1 + (n * 7 + u.id) % {len(WORDS)}] || ' ' || "
+            f"({words})[1 + (n * 13 + u.id) % {len(WORDS)}] || ' ' || repeat(md5(n::text) || ' ', 8), "
+            "u.id, u.create_at + make_interval(secs => n) "
+            "FROM users u CROSS JOIN generate_series(1, :per_user) n "
+            "WHERE u.email LIKE 'explain-' || :run || '-%'"
+        ), {"run": run, "per_user": notes_per_user})
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE users"))
+        conn.execute(text("ANALYZE notes"))
+    print(f"Seeded {users} users x {notes_per_user} notes in {time.perf_counter() - started:.1f}s")
+
+
+# --------------------------------------------------
+# HOT QUERIES
+# --------------------------------------------------
+
+def hot_queries(engine) -> dict:
+    # The statements the routers build, for a typical user and page
+    from sqlalchemy import Integer, any_, bindparam, delete, func, select
+    from sqlalchemy.dialects.postgresql import ARRAY
+
+    from app.models import models
+    from app.routers.notes import NOTE_FIELDS
+    from app.routers.user import USER_FIELDS
+    from app.search.search import search_query
+    from app.utils.pagination import DEFAULT_PAGE_SIZE, encode_cursor, keyset_select
+
+    Notes, User = models.Notes, models.User
+    with engine.connect() as conn:
+        busiest = conn.execute(
+            select(Notes.user_id, func.count().label("notes"))
+            .group_by(Notes.user_id).order_by(func.count().desc(), Notes.user_id).limit(1)
+        ).first()
+        if busiest is None or busiest.notes < 2:
+            sys.exit("Not enough notes to check paging; seed more (--notes-per-user)")
+        user_id = busiest.user_id
+        # Cursor one page in, or as far as a small seed allows
+        middle = conn.execute(
+            select(Notes.create_at, Notes.id).where(Notes.user_id == user_id)
+            .order_by(Notes.create_at, Notes.id).offset(min(DEFAULT_PAGE_SIZE, busiest.notes - 1)).limit(1)
+        ).first()
+        note_ids = list(conn.scalars(select(Notes.id).where(Notes.user_id == user_id).limit(8)))
+
+    cursor = encode_cursor(middle.create_at, middle.id)
+    own = Notes.user_id == user_id
+    page = DEFAULT_PAGE_SIZE + 1
+    query = search_query(WORDS[0])
+
+    return {
+        "notes: first page (user)": keyset_select(Notes, list(NOTE_FIELDS), None, own).limit(page),
+        "notes: next page (user)": keyset_select(Notes, list(NOTE_FIELDS), cursor, own).limit(page),
+        "notes: first page (admin)": keyset_select(Notes, list(NOTE_FIELDS), None).limit(page),
+        "notes: next page (admin)": keyset_select(Notes, list(NOTE_FIELDS), cursor).limit(page),
+        "notes: by id": select(Notes).where(Notes.id == note_ids[0]),
+        "notes: search (user)": (
+            select(Notes.id, func.ts_rank_cd(Notes.search_vector, query).label("rank"))
+            .where(Notes.search_vector.op("@@")(query), own)
+            .order_by(func.ts_rank_cd(Notes.search_vector, query).desc(), Notes.id)
+            .limit(8)
+        ),
+        "notes: ask context hydration": select(Notes.id, Notes.title, Notes.content).where(
+            Notes.id == any_(bindparam("note_ids", note_ids, type_=ARRAY(Integer))), own
+        ),
+        "notes: account purge batch": select(Notes.id, Notes.title, Notes.content).where(own).limit(500),
+        "notes: count for user": select(func.count()).where(own),
+        "notes: cascade from users": delete(Notes).where(own),
+        "users: first page": keyset_select(User, list(USER_FIELDS), None, User.deleted_at.is_(None)).limit(page),
+        "users: by email (login)": select(User).where(User.email == "explain@example.com", User.deleted_at.is_(None)),
+    }
+
+
+# --------------------------------------------------
+# PLANS
+# --------------------------------------------------
+
+def walk(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk(child)
+
+
+def explain(conn, stmt) -> dict:
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    result = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + compiled.string, compiled.params)
+    return result.scalar()[0]["Plan"]
+
+
+def check(engine, queries: dict) -> list[str]:
+    failures = []
+    print(f"{'query':<32} {'cost':>10}  access paths")
+    with engine.connect() as conn:
+        for name, stmt in queries.items():
+            plan = explain(conn, stmt)
+            paths = []
+            for node in walk(plan):
+                relation = node.get("Relation Name")
+                index = node.get("Index Name")
+                if not relation and not index:
+                    continue
+                paths.append(f"{node['Node Type']} {index or relation}")
+                if node["Node Type"] == "Seq Scan" and relation in CHECKED_TABLES:
+                    failures.append(f"{name}: sequential scan on {relation}")
+            print(f"{name:<32} {plan['Total Cost']:>10.1f}  {', '.join(paths)}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--notes-per-user", type=int, default=200)
+    parser.add_argument("--database-url", help="Postgres URL; default is an ephemeral pgserver instance")
+    parser.add_argument("--no-seed", action="store_true", help="check an already populated database")
+    args = parser.parse_args()
+
+    with benchmark_database(args.database_url) as database_url:
+        # The app reads its settings at import time
+        os.environ["SQLALCHEMY_DATABASE_URL"] = database_url
+        from app.database.database import engine
+        from app.database.migrations import run_migrations
+        from app.models import models
+
+        models.Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+        if not args.no_seed:
+            seed(engine, args.users, args.notes_per_user)
+
+        failures = check(engine, hot_queries(engine))
+        engine.dispose()
+
+    if failures:
+        print("\n".join(["", "FAILED:"] + failures))
+        sys.exit(1)
+    print("\nAll hot queries use indexes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Local stand-in for the OpenAI embeddings and chat completions API.
+
+Run from AI_notes/ (benchmarks.load starts it for you):
+
+    python -m benchmarks.fake_openai --port 8101 --embed-latency-ms 20 --chat-latency-ms 200
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8101/v1.
+Embeddings are deterministic per input text, so the embedding cache
+behaves as it would against the real API.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+
+import numpy as np
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+DIMENSION = 1536
+
+
+def fake_embedding(text: str) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(DIMENSION).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def create_app(embed_latency: float, chat_latency: float, token_latency: float, failure_rate: float) -> Starlette:
+    async def maybe_fail():
+        # The SDK retries 5xx, so injected failures also show up as latency
+        if random.random() < failure_rate:
+            return JSONResponse({"error": {"message": "injected failure", "type": "server_error"}}, status_code=500)
+        return None
+
+    async def embeddings(request: Request):
+        body = await request.json()
+        await asyncio.sleep(embed_latency)
+        if failure := await maybe_fail():
+            return failure
+
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        if not inputs or any(text == "" for text in inputs):
+            # Like the real API, which rejects empty strings
+            return JSONResponse(
+                {"error": {"message": "'$.input' is invalid", "type": "invalid_request_error"}}, status_code=400
+            )
+        as_base64 = body.get("encoding_format") == "base64"
+        data = []
+        for index, text in enumerate(inputs):
+            vector = fake_embedding(text)
+            embedding = base64.b64encode(vector.tobytes()).decode("ascii") if as_base64 else vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+
+        tokens = sum(len(text.split()) for text in inputs)
+        return JSONResponse({
+            "object": "list",
+            "data": data,
+            "model": body["model"],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        })
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await asyncio.sleep(chat_latency)
+        if failure := await maybe_fail():
+            return failure
+
+        prompt_tokens = sum(len(m["content"].split()) for m in body["messages"])
+        words = ["Based", " on", " your", " notes", ",", " here", " is", " the", " answer", "."]
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words), "total_tokens": prompt_tokens + len(words)}
+        base = {"id": "chatcmpl-bench", "created": int(time.time()), "model": body["model"]}
+
+        if not body.get("stream"):
+            return JSONResponse({
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)}, "finish_reason": "stop"}],
+                "usage": usage
+            })
+
+        async def chunks():
+            for word in words:
+                await asyncio.sleep(token_latency)
+                chunk = {**base, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return Starlette(routes=[
+        Route("/v1/embeddings", embeddings, methods=["POST"]),
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--embed-latency-ms", type=float, default=20)
+    parser.add_argument("--chat-latency-ms", type=float, default=200)
+    parser.add_argument("--token-latency-ms", type=float, default=5)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    app = create_app(
+        args.embed_latency_ms / 1000,
+        args.chat_latency_ms / 1000,
+        args.token_latency_ms / 1000,
+        args.failure_rate
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""End-to-end load test of the API against local stand-ins.
+
+Run from AI_notes/:
+
+    python -m benchmarks.load --concurrency 16 --requests 400
+    python -m benchmarks.load --json before.json
+    python -m benchmarks.load --compare before.json
+
+Starts the fake OpenAI server (benchmarks.fake_openai), the app with a
+simulated Pinecone (benchmarks.serve) and, unless --database-url is given,
+an ephemeral Postgres via the optional `pgserver` package
+(pip install pgserver). Seeds users and notes, then drives /login,
+POST /notes, GET /notes and /AI/ask one scenario at a time, reporting
+RPS and p50/p95/p99 latency. --json saves the numbers, --compare prints
+the change against a saved run.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+
+import httpx
+
+SCENARIOS = ("login", "write", "read", "ask")
+
+WORDS = (
+    "kubernetes helm deploy budget invoice travel flight hotel recipe garlic "
+    "meeting roadmap sprint python fastapi postgres index latency cache queue "
+    "garden tomato basil running marathon training book chapter review"
+).split()
+
+
+# --------------------------------------------------
+# PROCESSES
+# --------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+@contextmanager
+def ephemeral_postgres():
+    try:
+        import pgserver
+    except ImportError:
+        sys.exit("No --database-url given and pgserver is not installed (pip install pgserver)")
+
+    with tempfile.TemporaryDirectory(prefix="notes-bench-") as data_dir:
+        server = pgserver.get_server(data_dir, cleanup_mode="stop")
+        server.psql("CREATE DATABASE bench;")
+        yield f"postgresql://postgres@/bench?host={data_dir}"
+
+
+@contextmanager
+def benchmark_database(url: Optional[str] = None):
+    # The --database-url if one was given, otherwise an ephemeral instance
+    if url:
+        yield url
+        return
+    with ephemeral_postgres() as url:
+        yield url
+
+
+@contextmanager
+def stack(args, database_url: str):
+    api_port, openai_port = free_port(), free_port()
+    env = {
+        **os.environ,
+        "SQLALCHEMY_DATABASE_URL": database_url,
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "OPENAI_API_KEY": "bench",
+        "SECRET_KEY_JWT": os.environ.get("SECRET_KEY_JWT", "bench-secret"),
+        "VECTOR_BACKEND": "local",
+        "INDEX_POLL_INTERVAL": "0.2",
+        "LOG_LEVEL": "WARNING",
+        # Measure capacity, not the per-user quotas
+        "RATE_LIMIT_ENABLED": os.environ.get("RATE_LIMIT_ENABLED", "false"),
+    }
+    if args.bcrypt_rounds:
+        env["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+
+    subprocess.run([sys.executable, "-m", "app.cli", "init-db"], env=env, check=True, capture_output=True)
+
+    processes = []
+    try:
+        fake_openai = subprocess.Popen([
+            sys.executable, "-m", "benchmarks.fake_openai", "--port", str(openai_port),
+            "--embed-latency-ms", str(args.embed_latency_ms),
+            "--chat-latency-ms", str(args.chat_latency_ms),
+            "--failure-rate", str(args.openai_failure_rate),
+        ], env=env)
+        processes.append(fake_openai)
+
+        api = subprocess.Popen([
+            sys.executable, "-m", "benchmarks.serve", "--port", str(api_port),
+            "--vector-latency-ms", str(args.vector_latency_ms),
+            "--vector-failure-rate", str(args.vector_failure_rate),
+        ], env=env)
+        processes.append(api)
+
+        wait_ready(f"http://127.0.0.1:{openai_port}/", fake_openai)
+        wait_ready(f"http://127.0.0.1:{api_port}/", api)
+        yield f"http://127.0.0.1:{api_port}"
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(10)
+
+
+# --------------------------------------------------
+# SEEDING
+# --------------------------------------------------
+
+def note_text(rng: random.Random, words: int) -> dict:
+    return {
+        "title": " ".join(rng.choices(WORDS, k=3)),
+        "content": " ".join(rng.choices(WORDS, k=words))
+    }
+
+
+async def seed(client: httpx.AsyncClient, args) -> list[dict]:
+    run = uuid.uuid4().hex[:8]
+    rng = random.Random(args.seed)
+    users = []
+    for i in range(args.users):
+        email = f"bench-{run}-{i}@example.com"
+        r = await client.post("/users/", json={"username": f"bench{i}", "email": email, "password": "bench-pw"})
+        r.raise_for_status()
+        r = await client.post("/login", data={"username": email, "password": "bench-pw"})
+        r.raise_for_status()
+        users.append({"email": email, "headers": {"Authorization": f"Bearer {r.json()['access_token']}"}})
+
+    last_note = None
+    for user in users:
+        notes = [note_text(rng, rng.randint(20, 400)) for _ in range(args.notes_per_user)]
+        r = await client.post("/notes/bulk", json=notes, headers=user["headers"])
+        r.raise_for_status()
+        last_note = (user, r.json()["items"][-1]["id"])
+
+    # Outbox rows drain in id order, so the last note indexed means all are
+    deadline = time.monotonic() + 120
+    user, note_id = last_note
+    while time.monotonic() < deadline:
+        status = (await client.get(f"/notes/{note_id}/index-status", headers=user["headers"])).json()["status"]
+        if status == "indexed":
+            break
+        await asyncio.sleep(0.5)
+    else:
+        print("warning: seed notes not fully indexed", file=sys.stderr)
+    return users
+
+
+# --------------------------------------------------
+# SCENARIOS
+# --------------------------------------------------
+
+def make_request(scenario: str, users: list[dict], rng: random.Random, args):
+    user = rng.choice(users)
+    if scenario == "login":
+        return "POST", "/login", {"data": {"username": user["email"], "password": "bench-pw"}}
+    if scenario == "write":
+        return "POST", "/notes/", {"json": note_text(rng, rng.randint(20, 400)), "headers": user["headers"]}
+    if scenario == "read":
+        return "GET", "/notes/", {"params": {"limit": 50}, "headers": user["headers"]}
+    # Random questions, so the answer cache doesn't turn this into a cache benchmark
+    question = " ".join(rng.choices(WORDS, k=6)) + "?"
+    return "POST", "/AI/ask", {"json": {"question": question, "mode": args.ask_mode}, "headers": user["headers"]}
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: str, users: list[dict], args) -> dict:
+    rng = random.Random(args.seed)
+    latencies: list[float] = []
+    errors = 0
+    remaining = args.requests
+
+    async def worker():
+        nonlocal errors, remaining
+        while remaining > 0:
+            remaining -= 1
+            method, url, kwargs = make_request(scenario, users, rng, args)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        # Nearest-rank
+        return latencies[max(0, min(len(latencies) - 1, round(p / 100 * len(latencies)) - 1))] * 1000
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(50), 1),
+        "p95_ms": round(percentile(95), 1),
+        "p99_ms": round(percentile(99), 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+    }
+
+
+# --------------------------------------------------
+# REPORT
+# --------------------------------------------------
+
+COLUMNS = ("requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+
+
+def print_report(results: dict, baseline: dict = None):
+    print(f"{'scenario':<8} " + " ".join(f"{c:>9}" for c in COLUMNS))
+    for scenario, row in results.items():
+        print(f"{scenario:<8} " + " ".join(f"{row[c]:>9}" for c in COLUMNS))
+        if baseline and scenario in baseline:
+            deltas = []
+            for c in COLUMNS:
+                before = baseline[scenario].get(c)
+                deltas.append(f"{(row[c] - before) / before * 100:>+8.1f}%" if before else f"{'-':>9}")
+            print(f"{'  vs base':<8} " + " ".join(deltas))
+
+
+async def drive(base_url: str, args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        users = await seed(client, args)
+        return {scenario: await run_scenario(client, scenario, users, args) for scenario in args.scenarios}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400, help="requests per scenario")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--notes-per-user", type=int, default=50)
+    parser.add_argument("--ask-mode", choices=("vector", "keyword", "hybrid"), default="vector")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--database-url", help="Postgres URL; default is an ephemeral pgserver instance")
+    parser.add_argument("--bcrypt-rounds", type=int)
+    parser.add_argument("--embed-latency-ms", type=float, default=20)
+    parser.add_argument("--chat-latency-ms", type=float, default=200)
+    parser.add_argument("--vector-latency-ms", type=float, default=10)
+    parser.add_argument("--openai-failure-rate", type=float, default=0.0)
+    parser.add_argument("--vector-failure-rate", type=float, default=0.0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline results file to diff against")
+    args = parser.parse_args()
+
+    with benchmark_database(args.database_url) as database_url, stack(args, database_url) as base_url:
+        results = asyncio.run(drive(base_url, args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_report(results, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
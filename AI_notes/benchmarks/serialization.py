@@ -0,0 +1,156 @@
+"""Rows/sec of the GET /notes and GET /users list pages, before and after.
+
+Run from AI_notes/:
+
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --rows 5000 --page 1000 --repeat 20
+    python -m benchmarks.serialization --database-url postgresql://... --no-seed
+
+Seeds an ephemeral Postgres (optional `pgserver` package) unless
+--database-url is given, then times one page fetched and rendered three
+ways:
+
+    orm        ORM objects, validated through the response model and
+               encoded with the stdlib encoder (what response_model does)
+    validated  keyset row tuples, validated, encoded by pydantic-core
+    trusted    keyset row tuples encoded by orjson, no validation
+               (FAST_SERIALIZATION=true)
+
+Fetch and render are timed separately; the trusted body is checked to be
+byte-identical to the validated one.
+"""
+import argparse
+import json
+import os
+import time
+
+from .load import benchmark_database
+
+
+def seed(engine, rows: int):
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        user_id = conn.scalar(text(
+            "INSERT INTO users (email, password, role) "
+            "VALUES ('serialization-' || extract(epoch from now())::bigint || '@example.com', 'x', 'User') "
+            "RETURNING id"
+        ))
+        conn.execute(text(
+            "INSERT INTO notes (title, content, user_id, create_at) "
+            "SELECT 'note ' || n, repeat(md5(n::text) || ' ', 8), :user_id, now() + make_interval(secs => n) "
+            "FROM generate_series(1, :rows) n"
+        ), {"user_id": user_id, "rows": rows})
+        conn.execute(text(
+            "INSERT INTO users (email, password, role, create_at) "
+            "SELECT 'serialization-' || :user_id || '-' || g || '@example.com', 'x', 'User', "
+            "now() + make_interval(secs => g) "
+            "FROM generate_series(1, :rows) g"
+        ), {"user_id": user_id, "rows": rows})
+    return user_id
+
+
+# --------------------------------------------------
+# PATHS
+# --------------------------------------------------
+
+def paths(model, response_model, fields, where):
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+
+    from app.utils.pagination import keyset_select
+    from app.utils.serialization import RowSerializer
+
+    adapter = TypeAdapter(list[response_model])
+    validated, trusted = RowSerializer(response_model, trusted=False), RowSerializer(response_model, trusted=True)
+
+    def orm_render(objects):
+        # FastAPI's serialize_response + JSONResponse.render
+        content = jsonable_encoder(adapter.dump_python(adapter.validate_python(objects, from_attributes=True), mode="json"))
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    orm_stmt = select(model).where(*where).order_by(model.create_at, model.id)
+    row_stmt = keyset_select(model, list(fields), None, *where)
+    return {
+        "orm": (lambda session, n: session.scalars(orm_stmt.limit(n)).all(), orm_render),
+        "validated": (lambda session, n: session.execute(row_stmt.limit(n)).all(), validated.render),
+        "trusted": (lambda session, n: session.execute(row_stmt.limit(n)).all(), trusted.render),
+    }
+
+
+def measure(session_factory, fetch, render, page: int, repeat: int) -> tuple[float, float, bytes]:
+    fetch_s = render_s = 0.0
+    body = b""
+    for _ in range(repeat):
+        # A fresh session per page, like a request: no warm identity map
+        with session_factory() as session:
+            started = time.perf_counter()
+            rows = fetch(session, page)
+            fetched = time.perf_counter()
+            body = render(rows)
+            render_s += time.perf_counter() - fetched
+            fetch_s += fetched - started
+    return page * repeat / fetch_s, page * repeat / render_s, body
+
+
+def report(name: str, session_factory, candidates: dict, page: int, repeat: int):
+    print(f"\n{name}: {page} rows x {repeat} pages")
+    print(f"{'path':<10} {'fetch rows/s':>14} {'render rows/s':>14} {'total rows/s':>14}")
+    bodies = {}
+    for path, (fetch, render) in candidates.items():
+        with session_factory() as session:
+            fetch(session, page)  # warm up
+        fetch_rate, render_rate, bodies[path] = measure(session_factory, fetch, render, page, repeat)
+        total = 1 / (1 / fetch_rate + 1 / render_rate)
+        print(f"{path:<10} {fetch_rate:>14,.0f} {render_rate:>14,.0f} {total:>14,.0f}")
+    assert bodies["trusted"] == bodies["validated"], "trusted and validated bodies differ"
+    assert json.loads(bodies["orm"]) == json.loads(bodies["trusted"]), "orm and row bodies differ"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000, help="notes (and users) to seed")
+    parser.add_argument("--page", type=int, default=1000, help="rows per page; MAX_PAGE_SIZE is 1000")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--database-url", help="Postgres URL; default is an ephemeral pgserver instance")
+    parser.add_argument("--no-seed", action="store_true", help="use the user with the most notes")
+    args = parser.parse_args()
+
+    with benchmark_database(args.database_url) as database_url:
+        # The app reads its settings at import time
+        os.environ["SQLALCHEMY_DATABASE_URL"] = database_url
+        from sqlalchemy import func, select
+
+        from app.database.database import SessionLocal, engine
+        from app.database.migrations import run_migrations
+        from app.models import models
+        from app.routers.notes import NOTE_FIELDS
+        from app.routers.user import USER_FIELDS
+        from app.schemas.schemas import NotesResponse, UserResponse
+
+        models.Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+        if args.no_seed:
+            with engine.connect() as conn:
+                user_id = conn.scalar(
+                    select(models.Notes.user_id).group_by(models.Notes.user_id).order_by(func.count().desc()).limit(1)
+                )
+        else:
+            user_id = seed(engine, args.rows)
+
+        report(
+            "GET /notes", SessionLocal,
+            paths(models.Notes, NotesResponse, NOTE_FIELDS, [models.Notes.user_id == user_id]),
+            args.page, args.repeat
+        )
+        report(
+            "GET /users", SessionLocal,
+            paths(models.User, UserResponse, USER_FIELDS, [models.User.deleted_at.is_(None)]),
+            args.page, args.repeat
+        )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
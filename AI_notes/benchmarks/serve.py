@@ -0,0 +1,69 @@
+"""Run the API with an in-memory vector store that simulates Pinecone.
+
+Run from AI_notes/ (benchmarks.load starts it for you):
+
+    python -m benchmarks.serve --port 8100 --vector-latency-ms 10 --vector-failure-rate 0.01
+
+Database and OpenAI settings come from the usual environment variables
+(SQLALCHEMY_DATABASE_URL, OPENAI_BASE_URL, ...). The store lives in this
+process, so the app is served by a single uvicorn worker.
+"""
+import argparse
+import random
+import time
+
+import uvicorn
+
+from app.vectorstore.vectorstore import LocalVectorStore, VectorStore
+
+
+class SimulatedPinecone(VectorStore):
+    # LocalVectorStore plus a network round trip and random upstream errors
+    def __init__(self, latency: float, failure_rate: float):
+        self.store = LocalVectorStore()
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    def _call(self):
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise RuntimeError("injected vector store failure")
+
+    def upsert(self, vectors):
+        self._call()
+        self.store.upsert(vectors)
+
+    def query(self, vector, top_k, filter=None, include_metadata=True):
+        self._call()
+        return self.store.query(vector, top_k, filter, include_metadata)
+
+    def delete(self, ids=None, filter=None):
+        self._call()
+        self.store.delete(ids, filter)
+
+    def list_ids(self, prefix):
+        self._call()
+        return self.store.list_ids(prefix)
+
+    def existing_ids(self, ids):
+        self._call()
+        return self.store.existing_ids(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--vector-latency-ms", type=float, default=10)
+    parser.add_argument("--vector-failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    from app.clients.clients import set_vector_store
+    from app.main import app
+
+    set_vector_store(SimulatedPinecone(args.vector_latency_ms / 1000, args.vector_failure_rate))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()